@@ -0,0 +1,70 @@
+import os
+import time
+import logging
+import resource
+import tracemalloc
+import importlib.util
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger()
+
+
+def load_generator(file_name):
+    # 按文件名加载同目录下的生成脚本（文件名里有中文和点号，不能直接import）
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+    spec = importlib.util.spec_from_file_location(file_name.split("_")[2], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(func, indices):
+    """
+    分两遍运行：第一遍只计时，第二遍打开 tracemalloc 统计内存
+
+    minor page faults 统计的是新分配的内存页被第一次写入的次数
+    大整数的limb数组很大时malloc会直接向系统申请新的页，所以它能反映大块内存被反复申请释放的情况
+    tracemalloc 则统计Python层面的分配（每个mpz对象本身）
+    """
+    start_time = time.perf_counter()
+    for index in indices:
+        func(index)
+    elapsed = time.perf_counter() - start_time
+
+    faults_before = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    tracemalloc.start()
+    for index in indices:
+        func(index)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults_before
+    return elapsed, faults, peak
+
+
+def main():
+    start = int(input("请输入测试的起始项: "))
+    count = int(input("请输入测试的项数: "))
+    indices = range(start, start + count)
+
+    ver26 = load_generator("run_generate_ver26_numpy_refactored_单文件战神版.py")
+    ver27 = load_generator("run_generate_ver27_单文件战神版.py")
+
+    def ver26_tuple(index):
+        ver26.matrix_multiply.cache_clear()
+        ver26.matrix_power.cache_clear()
+        ver26.fibonacci.cache_clear()
+        return ver26.fibonacci(12 * index + 3), ver26.fibonacci(12 * index + 4)
+
+    def ver27_doubling(index):
+        return ver27.fibonacci_pair(12 * index + 3)
+
+    def ver27_xmpz(index):
+        return ver27.fibonacci_pair_xmpz(12 * index + 3)
+
+    for name, func in (("ver26 三元组矩阵", ver26_tuple), ("ver27 快速倍增", ver27_doubling), ("ver27 xmpz原地", ver27_xmpz)):
+        elapsed, faults, peak = measure(func, indices)
+        logger.info(f"{name:<16}耗时 = {elapsed:<12.4f}秒  minor page faults = {faults:<10}Python内存峰值 = {peak} 字节")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import random
+import logging
+import tempfile
+import subprocess
+import importlib.util
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger()
+
+GENERATOR = "run_generate_ver27_单文件战神版.py"
+
+
+def load_generator(file_name):
+    # 按文件名加载同目录下的生成脚本（文件名里有中文和点号，不能直接import）
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+    spec = importlib.util.spec_from_file_location(file_name.split("_")[2], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module, path
+
+
+def cold_extend(path, n, work_dir):
+    """每个请求都重新运行一次脚本：创建进程池、读取上一个结果文件、从头预热缓存"""
+    start_time = time.perf_counter()
+    subprocess.run([sys.executable, path], input=f"{n}\n", text=True, cwd=work_dir, capture_output=True, check=True)
+    return time.perf_counter() - start_time
+
+
+def cold_range(generator, start_index, end_index, work_dir):
+    """没有常驻服务时，取一段结果要新开一个进程打开结果文件"""
+    code = (f"import numpy as np; print(np.memmap('{generator.RESULT_LOG}', dtype=np.{generator.RESULT_DTYPE}, mode='r', "
+            f"offset={generator.RESULT_HEADER_SIZE})[{start_index}:{end_index}].tolist())")
+    start_time = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=work_dir, capture_output=True, check=True)
+    return time.perf_counter() - start_time
+
+
+def timed_query(generator, request, socket_path):
+    start_time = time.perf_counter()
+    generator.query(request, socket_path)
+    return time.perf_counter() - start_time
+
+
+def wait_for_socket(generator, socket_path, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            generator.query({"cmd": "ping"}, socket_path)
+            return
+        except (FileNotFoundError, ConnectionRefusedError):
+            time.sleep(0.05)
+    raise TimeoutError(f"{timeout} 秒内服务没有启动")
+
+
+def report(name, times):
+    times = sorted(times)
+    logger.info(f"{name:<16}中位数 = {times[len(times) // 2]:<10.4f}秒  最大 = {times[-1]:<10.4f}秒  共 {len(times)} 次")
+
+
+def main():
+    initial = int(input("请输入初始的项数: "))
+    step = int(input("请输入每次请求扩展的项数: "))
+    rounds = int(input("请输入请求次数: "))
+    generator, path = load_generator(GENERATOR)
+
+    # 两边各用一个临时目录，先算好相同的初始结果，之后的请求都从同一个起点开始；结束时连同结果、周期表和socket一起删除
+    with tempfile.TemporaryDirectory() as cold_dir, tempfile.TemporaryDirectory() as warm_dir:
+        socket_path = os.path.join(warm_dir, generator.SOCKET_PATH)
+        cold_extend(path, initial, cold_dir)
+        server = subprocess.Popen([sys.executable, path, "serve"], cwd=warm_dir,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_socket(generator, socket_path)
+            generator.query({"cmd": "extend", "n": initial}, socket_path)
+
+            cold_extends, warm_extends, cold_ranges, warm_ranges = [], [], [], []
+            for r in range(1, rounds + 1):
+                n = initial + r * step
+                cold_extends.append(cold_extend(path, n, cold_dir))
+                warm_extends.append(timed_query(generator, {"cmd": "extend", "n": n}, socket_path))
+                start_index = random.randrange(n - step)
+                cold_ranges.append(cold_range(generator, start_index, start_index + step, cold_dir))
+                warm_ranges.append(timed_query(generator, {"cmd": "range", "start": start_index, "end": start_index + step},
+                                               socket_path))
+
+            report("冷启动 扩展", cold_extends)
+            report("常驻服务 扩展", warm_extends)
+            report("冷启动 取区间", cold_ranges)
+            report("常驻服务 取区间", warm_ranges)
+            generator.query({"cmd": "stop"}, socket_path)
+            server.wait(timeout=60)
+        finally:
+            if server.poll() is None:
+                server.terminate()
+                server.wait(timeout=60)  # 服务退出后才能删除它的目录
+
+
+if __name__ == "__main__":
+    main()
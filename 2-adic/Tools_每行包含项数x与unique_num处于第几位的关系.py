@@ -1,23 +1,11 @@
-import os
-import re
 import logging
 import time
+from tools_common import open_results, get_latest_file
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 logger = logging.getLogger()
 
 
-def get_latest_file():
-    # 获取当前目录下所有output_n={n}.txt文件，并找到n最大的文件
-    files = [f for f in os.listdir(".") if re.match(r"output_n=\d+\.txt", f)]
-    if not files:
-        return None
-    files.sort(
-        key=lambda x: int(re.search(r"output_n=(\d+).txt", x).group(1)), reverse=True
-    )
-    return files[0]
-
-
 def find_unique_num_position(matrix, x):
     """
     小心列表索引超出范围！！！
@@ -38,12 +26,10 @@ def find_unique_num_position(matrix, x):
 def main():
     latest_file = get_latest_file()
     if latest_file:
-        n_value = re.search(r"output_n=(\d+).txt", latest_file).group(1)
-        output_filename = f"output_Tools_自动查找每个数字出现在数列的第几项_n={n_value}.txt"
         logger.info(f"找到最新的文件：{latest_file}")
-
-        with open(latest_file, "r") as file:
-            numbers = list(map(int, file.read().strip().split()))
+        numbers = open_results(latest_file)  # 每一行只是其中的一个切片，不会复制数据
+        n_value = len(numbers)
+        output_filename = f"output_Tools_自动查找每个数字出现在数列的第几项_n={n_value}.txt"
 
         # 预定义的每行包含项数x的列表，x为2的幂
         x_values = [2**i for i in range(1, int(len(numbers) ** 0.5) + 1)]
@@ -84,7 +70,7 @@ def main():
         logger.info(f"程序运行时间: {end_time - start_time} 秒")
 
     else:
-        logger.info("未找到output_n={n}.txt文件。")
+        logger.info("未找到结果文件。")
 
 
 if __name__ == "__main__":
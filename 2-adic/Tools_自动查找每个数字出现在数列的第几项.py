@@ -1,27 +1,12 @@
-import os
-import re
+import numpy as np
+from tools_common import open_results, get_latest_file
 
 
-def get_latest_file():
-    # 获取当前目录下所有output_n={n}.txt文件，并找到n最大的文件
-    files = [f for f in os.listdir(".") if re.match(r"output_n=\d+\.txt", f)]
-    if not files:
-        return None
-    files.sort(
-        key=lambda x: int(re.search(r"output_n=(\d+).txt", x).group(1)), reverse=True
-    )
-    return files[0]
-
-
-def find_number_positions(filename):
-    # 读取文件并找出每个数字出现的位置
+def find_number_positions(numbers):
+    # 找出每个数字出现的位置
     number_positions = {}
-    with open(filename, "r") as file:
-        numbers = file.read().strip().split()
-        for index, number in enumerate(numbers, start=1):  # 从1开始计数
-            if number not in number_positions:
-                number_positions[number] = []
-            number_positions[number].append(index)
+    for number in np.unique(numbers):
+        number_positions[int(number)] = (np.flatnonzero(numbers == number) + 1).tolist()  # 从1开始计数
     return number_positions
 
 
@@ -29,10 +14,11 @@ def main():
     latest_file = get_latest_file()
     if latest_file:
         print(f"找到最新的文件：{latest_file}")
-        n_value = re.search(r"output_n=(\d+).txt", latest_file).group(1)
+        numbers = open_results(latest_file)
+        n_value = len(numbers)
         output_filename = f"output_n={n_value}_Tools_自动查找每个数字出现在数列的第几项_.txt"
 
-        number_positions = find_number_positions(latest_file)
+        number_positions = find_number_positions(numbers)
 
         # 对数字进行排序，确保输出按照数字顺序进行
         sorted_numbers = sorted(number_positions.keys(), key=int)
@@ -46,7 +32,7 @@ def main():
 
         print(f"结果已写入到 {output_filename}")
     else:
-        print("未找到output_n={n}.txt文件。")
+        print("未找到结果文件。")
 
 
 if __name__ == "__main__":
@@ -1,16 +1,4 @@
-import os
-import re
-
-
-def get_latest_file():
-    # 获取当前目录下所有output_n={n}.txt文件，并找到n最大的文件
-    files = [f for f in os.listdir(".") if re.match(r"output_n=\d+\.txt", f)]
-    if not files:
-        return None
-    files.sort(
-        key=lambda x: int(re.search(r"output_n=(\d+).txt", x).group(1)), reverse=True
-    )
-    return files[0]
+from tools_common import open_results, get_latest_file
 
 
 def process_numbers(numbers):
@@ -38,13 +26,12 @@ def main():
     if latest_file:
         print(f"找到最新的文件：{latest_file}")
 
-        with open(latest_file, "r") as file:
-            numbers = list(map(int, file.read().strip().split()))  # 读取数字并转换为整数列表
+        numbers = open_results(latest_file).tolist()  # 转换为整数列表
 
         indexes = process_numbers(numbers)
         print(" ".join(map(str, indexes)))  # 输出结果
     else:
-        print("未找到output_n={n}.txt文件。")
+        print("未找到结果文件。")
 
 
 if __name__ == "__main__":
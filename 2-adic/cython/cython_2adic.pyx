@@ -0,0 +1,102 @@
+# cython_2adic.pyx
+# cython: language_level=3
+from libc.stdlib cimport malloc, free
+from libc.limits cimport ULONG_MAX
+from gmpy2 cimport mpz_t
+
+cdef extern from "gmp.h" nogil:
+    ctypedef unsigned long mp_bitcnt_t
+
+    void mpz_init(mpz_t x)
+    void mpz_clear(mpz_t x)
+    void mpz_set_ui(mpz_t rop, unsigned long op)
+    void mpz_swap(mpz_t rop1, mpz_t rop2)
+    void mpz_add(mpz_t rop, mpz_t op1, mpz_t op2)
+    void mpz_sub(mpz_t rop, mpz_t op1, mpz_t op2)
+    void mpz_mul(mpz_t rop, mpz_t op1, mpz_t op2)
+    void mpz_mul_ui(mpz_t rop, mpz_t op1, unsigned long op2)
+    void mpz_addmul_ui(mpz_t rop, mpz_t op1, unsigned long op2)
+    void mpz_mul_2exp(mpz_t rop, mpz_t op1, mp_bitcnt_t op2)
+    mp_bitcnt_t mpz_scan1(mpz_t op, mp_bitcnt_t starting_bit)
+
+
+cdef void fibonacci_pair(unsigned long n, mpz_t a, mpz_t b, mpz_t c, mpz_t d) noexcept nogil:
+    """
+    快速倍增算法，结果 (F(n), F(n+1)) 写入a和b，c和d是临时变量
+
+    F(2k)   = F(k) * (2 * F(k+1) - F(k))
+    F(2k+1) = F(k)^2 + F(k+1)^2
+    """
+    cdef int shift = 0
+    while n >> shift > 1:
+        shift += 1
+    mpz_set_ui(a, 0)
+    mpz_set_ui(b, 1)
+    if n == 0:
+        return
+    while shift >= 0:
+        mpz_mul_2exp(c, b, 1)
+        mpz_sub(c, c, a)
+        mpz_mul(c, c, a)  # c = F(2k)
+        mpz_mul(d, a, a)
+        mpz_mul(a, b, b)
+        mpz_add(d, d, a)  # d = F(2k+1)
+        if (n >> shift) & 1:
+            mpz_add(b, c, d)
+            mpz_swap(a, d)
+        else:
+            mpz_swap(a, c)
+            mpz_swap(b, d)
+        shift -= 1
+
+
+cdef void calculate_batch_c(unsigned long start_index, unsigned long batch_size,
+                            unsigned long* results) noexcept nogil:
+    """
+    整批计算都在预先分配好的mpz_t上完成，循环中不创建任何Python对象
+
+    批次开头做一次快速倍增，之后用Q^12 = | 233 144 | 向前推进
+                                         | 144  89 |
+    Ln的分子能被5整除且5是奇数，所以直接对分子求最低位的1
+    """
+    cdef mpz_t fib1, fib2, t1, t2
+    cdef unsigned long i, k
+    mpz_init(fib1)
+    mpz_init(fib2)
+    mpz_init(t1)
+    mpz_init(t2)
+    fibonacci_pair(12 * start_index + 3, fib1, fib2, t1, t2)
+    for i in range(batch_size):
+        if i:
+            mpz_mul_ui(t1, fib2, 144)
+            mpz_addmul_ui(t1, fib1, 89)  # F(k+12) = F(12) * F(k+1) + F(11) * F(k)
+            mpz_mul_ui(t2, fib2, 233)
+            mpz_addmul_ui(t2, fib1, 144)  # F(k+13) = F(13) * F(k+1) + F(12) * F(k)
+            mpz_swap(fib1, t1)
+            mpz_swap(fib2, t2)
+        k = 12 * (start_index + i) + 3
+        mpz_mul_ui(t1, fib1, 4 * k - 1)
+        mpz_addmul_ui(t1, fib2, 2 * k)
+        results[i] = mpz_scan1(t1, 0)
+    mpz_clear(fib1)
+    mpz_clear(fib2)
+    mpz_clear(t1)
+    mpz_clear(t2)
+
+
+cpdef list calculate_batch(unsigned long start_index, unsigned long batch_size):
+    """计算一批2-adic数，计算过程中释放GIL，可以直接用多线程跑满所有核心"""
+    if batch_size == 0:
+        return []
+    # 最后一项的4k-1要放得进 unsigned long（Windows上只有32位），先转成Python整数再算，这里的算式本身不会回绕
+    if 4 * (12 * (<object>start_index + batch_size - 1) + 3) - 1 > ULONG_MAX:
+        raise OverflowError("4k - 1 超出了 unsigned long 的范围")
+    cdef unsigned long* results = <unsigned long*> malloc(batch_size * sizeof(unsigned long))
+    if results == NULL:
+        raise MemoryError()
+    try:
+        with nogil:
+            calculate_batch_c(start_index, batch_size, results)
+        return [results[i] for i in range(batch_size)]
+    finally:
+        free(results)
@@ -1,9 +1,24 @@
 # setup.py
-from setuptools import setup
+import os
+import gmpy2
+from setuptools import setup, Extension
 from Cython.Build import cythonize
 
 # 注意：你可能需要添加额外的库或路径，根据 gmpy2 在你系统中的安装
+# gmpy2.pxd 会引入 gmpy2.h、mpfr.h 和 mpc.h，这些头文件随 gmpy2 一起安装在它的包目录下
+# 编译：python setup.py build_ext --inplace
+# 旧的 cython_fib.pyx 在新版Cython中无法编译（结构体中不能存放Python对象），也没有脚本再用到它，所以不再编译
 setup(
-    ext_modules=cythonize("cython_fib.pyx", annotate=True),
-    compiler_directives={'language_level': "3"}
+    ext_modules=cythonize(
+        [
+            Extension(
+                "cython_2adic",
+                ["cython_2adic.pyx"],
+                include_dirs=[os.path.dirname(gmpy2.__file__)],
+                libraries=["gmp"],
+            ),
+        ],
+        annotate=True,
+        compiler_directives={'language_level': "3"},
+    ),
 )
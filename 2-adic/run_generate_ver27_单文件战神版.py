@@ -0,0 +1,1935 @@
+import time
+import math
+import logging
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener
+import gmpy2
+import os
+import sys
+import re
+import queue
+import itertools
+import struct
+import zlib
+import mmap
+import json
+import socket
+import socketserver
+import numpy as np
+from collections import OrderedDict
+from multiprocessing import Pool, shared_memory
+from multiprocessing.pool import ThreadPool
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger()
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "cython"))
+try:
+    import cython_2adic  # 需要先在 cython 目录下编译：python setup.py build_ext --inplace
+except ImportError:
+    cython_2adic = None
+
+FIB_MATRIX = (1, 1, 0)
+CACHE_BYTES = 32 * 1024 * 1024  # 每个进程中缓存最多占用的字节数
+
+
+class ExponentCache:
+    """
+    以指数（整数）为键的缓存，取代 lru_cache
+
+    lru_cache 以参数为键，参数是几百万位的矩阵时，每次查找都要对这些大整数求哈希
+    而且它只限制条数不限制大小，128个巨大的矩阵足以占满内存
+    这里的键是指数，值按其中大整数的总字节数计入预算，超出预算时淘汰最久未使用的项
+    """
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def size_of(value):
+        return sum((x.bit_length() + 7) // 8 for x in value)
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        size = self.size_of(value)
+        if size > self.max_bytes or key in self.entries:
+            return
+        self.entries[key] = value
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= self.size_of(evicted)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.bytes}
+
+
+jump_cache = ExponentCache()  # 以间隔d为键的 Q^(12d)，只缓存确实会重复用到的推进矩阵
+
+
+def matrix_multiply(matrix1, matrix2):
+    """
+    矩阵乘法
+
+    一个三元组(a, b, c)被用来表示一个2x2的矩阵
+    | a b | * | d e |
+    | b c |   | e f |
+    """
+
+    a, b, c = matrix1
+    d, e, f = matrix2
+    ad = gmpy2.mul(a, d)
+    be = gmpy2.mul(b, e)
+    return (
+        ad + be,
+        gmpy2.mul(a, e) + gmpy2.mul(b, f),
+        be + gmpy2.mul(c, f),
+    )
+
+
+def matrix_power(matrix, power):
+    """
+    递归快速幂算法
+
+    如果幂大于1，函数先计算矩阵的半个幂，然后判断幂是否为偶数
+    如果是偶数，就返回半个幂的矩阵乘以自身的结果
+    如果是奇数，就返回原矩阵乘以半个幂的矩阵乘以自身的结果
+
+    对于任意的非零实数a和非负整数n，有以下性质：
+    如果n是偶数，那么a^n = (a^(n/2))^2。例如 a^4 = (a^2)^2
+    如果n是奇数，那么a^n = a * a^(n-1)。例如 a^5 = a * a^4
+
+    最终：
+    原来需要O(n)次乘法的问题，变成了O(log(n))次乘法的问题
+    """
+
+    if power <= 0:
+        return 1, 0, 0
+    elif power == 1:
+        return matrix
+    else:
+        half_power = matrix_power(matrix, power // 2)
+        half_power_squared = matrix_multiply(half_power, half_power)
+        return matrix_multiply(matrix, half_power_squared) if power % 2 else half_power_squared
+
+
+def fibonacci_pair(n):
+    """
+    快速倍增算法，一次返回相邻的两项 (F(n), F(n+1))
+
+    由矩阵快速幂的平方步骤化简可得：
+    F(2k)   = F(k) * (2 * F(k+1) - F(k))
+    F(2k+1) = F(k)^2 + F(k+1)^2
+
+    从n的最高位开始逐位处理（迭代而不是递归）：
+    每一位先把 (F(k), F(k+1)) 倍增为 (F(2k), F(2k+1))
+    如果这一位是1，再前进一步得到 (F(2k+1), F(2k+2))
+
+    每一位只需要3次大数乘法，矩阵版本的一次平方则需要4到5次
+    并且F(n+1)是顺带算出来的，不用再单独做一次快速幂
+
+    不做缓存：每一项、每个批次的n都不相同，缓存永远不会命中，只会白白占用内存
+    """
+    a, b = gmpy2.mpz(0), gmpy2.mpz(1)
+    for bit in bin(n)[2:] if n > 0 else "":
+        c = gmpy2.mul(a, 2 * b - a)
+        d = gmpy2.mul(a, a) + gmpy2.mul(b, b)
+        a, b = (d, c + d) if bit == "1" else (c, d)
+    return a, b
+
+
+xmpz_buffers = None  # 每个工作进程各自持有一组可变的xmpz缓冲区
+
+
+def fibonacci_pair_xmpz(n):
+    """
+    快速倍增算法的原地运算版本，结果与 fibonacci_pair 相同
+
+    整个倍增过程只在4个xmpz缓冲区上原地更新（*=、+=、-=、<<=），不再为每个乘积和中间和分配新的mpz
+    需要"赋值"时用 x *= 0; x += y 把y复制进x，这样x原有的内存会被继续使用
+    交换两个缓冲区只交换Python中的引用，不复制数据
+    """
+    global xmpz_buffers
+    if xmpz_buffers is None:
+        xmpz_buffers = [gmpy2.xmpz(0) for _ in range(4)]
+    a, b, c, d = xmpz_buffers
+    a *= 0
+    b *= 0
+    b += 1
+    for bit in bin(n)[2:] if n > 0 else "":
+        c *= 0
+        c += b
+        c <<= 1
+        c -= a
+        c *= a  # c = F(2k)
+        d *= 0
+        d += a
+        d *= a
+        a *= 0
+        a += b
+        a *= b
+        d += a  # d = F(2k+1)
+        if bit == "1":
+            b *= 0
+            b += c
+            b += d
+            a, d = d, a
+        else:
+            a, c = c, a
+            b, d = d, b
+    xmpz_buffers = [a, b, c, d]
+    return gmpy2.mpz(a), gmpy2.mpz(b)
+
+
+STEP_MATRIX = matrix_power(FIB_MATRIX, 12)  # 相邻两项的k恰好相差12，预先算好Q^12
+
+
+def step_pair(fib1, fib2, matrix=None):
+    """
+    用预先算好的Q^12把(F(k), F(k+1))推进到(F(k+12), F(k+13))
+
+    | F(k+13) |   =   | F(13) F(12) | * | F(k+1) |
+    | F(k+12) |       | F(12) F(11) |   | F(k)   |
+
+    Q^12的元素都是小整数，所以每一项只需要4次"小数乘大数"，代价是O(n)而不是O(n log n)
+    传入其他的 matrix = Q^m 时同理，一次推进m步
+    """
+    a, b, c = STEP_MATRIX if matrix is None else matrix
+    return gmpy2.mul(b, fib2) + gmpy2.mul(c, fib1), gmpy2.mul(a, fib2) + gmpy2.mul(b, fib1)
+
+
+def jump_matrix(distance):
+    """
+    Q^(12 * distance)，用 step_pair 一次推进distance项
+
+    相同的间隔会反复出现（固定大小的批次到检查点的距离、稀疏查询中等间隔的项），所以按distance缓存
+    """
+    matrix = jump_cache.get(distance)
+    if matrix is None:
+        jump1, jump2 = fibonacci_pair(12 * distance)
+        matrix = (jump2, jump1, jump2 - jump1)
+        jump_cache.put(distance, matrix)
+    return matrix
+
+
+def calculate_2adic(index, fib1, fib2):
+    """核心算法，fib1 = F(12 * index + 3)，fib2 = F(12 * index + 4)"""
+    k = 12 * index + 3
+    Ln = ((4 * k - 1) * fib1 + 2 * k * fib2) // 5
+    result = gmpy2.bit_scan1(Ln)
+    return result if result is not None else 0
+
+
+def calculate_batch_doubling(start_index, batch_size):
+    """每一项都单独做一次快速倍增，同时拿到fib1和fib2"""
+    results = [0] * batch_size
+    for i in range(batch_size):
+        index = start_index + i
+        fib1, fib2 = fibonacci_pair(12 * index + 3)
+        results[i] = calculate_2adic(index, fib1, fib2)
+    return results
+
+
+def calculate_batch_xmpz(start_index, batch_size):
+    """和 doubling 模式一样每一项单独做快速倍增，但全程在xmpz缓冲区上原地运算"""
+    results = [0] * batch_size
+    for i in range(batch_size):
+        index = start_index + i
+        fib1, fib2 = fibonacci_pair_xmpz(12 * index + 3)
+        results[i] = calculate_2adic(index, fib1, fib2)
+    return results
+
+
+CHECKPOINT_DIR = "output_fib_checkpoints"
+CHECKPOINT_STRIDE = 1 << 12  # 检查点之间最少相隔的项数，检查点都在它的倍数上
+CHECKPOINT_DISTANCE_RATIO = 64  # 检查点到目标项的距离不超过index的1/64时才使用
+CHECKPOINT_MIN_INDEX = CHECKPOINT_STRIDE * CHECKPOINT_DISTANCE_RATIO  # 更小的项快速倍增本来就很快，不值得存
+CHECKPOINT_BYTES = 4 * 1024 ** 3  # 所有检查点在磁盘上最多占用的字节数
+CHECKPOINT_LENGTH = struct.Struct("<Q")  # 检查点文件开头记录F(k)的二进制长度，之后依次是F(k)和F(k+1)
+
+
+def checkpoint_path(index):
+    return os.path.join(CHECKPOINT_DIR, f"i={index}.bin")
+
+
+def save_checkpoint(index, fib1, fib2):
+    """把第index项的 (F(k), F(k+1)) 用 gmpy2.to_binary 存到磁盘上"""
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = checkpoint_path(index)
+    data = gmpy2.to_binary(fib1)
+    with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+        f.write(CHECKPOINT_LENGTH.pack(len(data)))
+        f.write(data)
+        f.write(gmpy2.to_binary(fib2))
+    os.replace(f"{path}.{os.getpid()}.tmp", path)  # 多个进程同时存同一个检查点时，内容都一样，谁最后替换都可以
+
+
+def load_checkpoint(index):
+    """mmap打开检查点文件，只读入需要的部分，没有这个检查点时返回None"""
+    try:
+        f = open(checkpoint_path(index), "rb")
+    except FileNotFoundError:
+        return None
+    with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        (length,) = CHECKPOINT_LENGTH.unpack_from(data)
+        start = CHECKPOINT_LENGTH.size
+        return gmpy2.from_binary(data[start:start + length]), gmpy2.from_binary(data[start + length:])
+
+
+def seed_pair(index, save=True):
+    """
+    第index项的 (F(k), F(k+1))，k = 12*index+3，用作一个批次的起点
+
+    依次查找不超过index的 CHECKPOINT_STRIDE、2*CHECKPOINT_STRIDE、4*CHECKPOINT_STRIDE……的倍数上的检查点，
+    找到后用 Q^(12d) 一次推进剩下的d项
+    推进要做4次 F(k) 乘 Q^(12d) 元素的不等长乘法，实测在index为2^20时，d = index/16 就已经和整个快速倍增差不多慢了，
+    所以只接受 d 不超过 index / CHECKPOINT_DISTANCE_RATIO 的检查点（d = index/64 时约省三成，d在一个步长内时省一半以上）
+    一个都找不到时，在最近的 CHECKPOINT_STRIDE 的倍数上做一次快速倍增并存为检查点，之后所有进程、所有运行都可以直接用
+    save=False 时只读已有的检查点，找不到就直接对index做快速倍增，不写任何文件
+    """
+    if index < CHECKPOINT_MIN_INDEX:
+        return fibonacci_pair(12 * index + 3)
+    stride = CHECKPOINT_STRIDE
+    pair = None
+    while pair is None and (index % stride) * CHECKPOINT_DISTANCE_RATIO <= index:
+        checkpoint = index - index % stride
+        pair = load_checkpoint(checkpoint)
+        stride *= 2
+    if pair is None and not save:
+        return fibonacci_pair(12 * index + 3)
+    if pair is None:
+        checkpoint = index - index % CHECKPOINT_STRIDE
+        pair = fibonacci_pair(12 * checkpoint + 3)
+        save_checkpoint(checkpoint, *pair)
+    distance = index - checkpoint
+    if not distance:
+        return pair
+    return step_pair(*pair, jump_matrix(distance))
+
+
+def evict_checkpoints(max_bytes=CHECKPOINT_BYTES):
+    """
+    检查点超出磁盘预算时删掉一部分
+
+    index最大的一个总是保留，续算时最需要它
+    其余的按层级从低到高删除：index / CHECKPOINT_STRIDE 末尾0的个数就是层级，同一层中先删index小的（也是小的文件）
+    每次删掉的都是最密的一层，剩下的检查点仍是间隔为2的幂的阶梯，只是更稀疏，seed_pair 会改用更高一层的检查点
+    """
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return
+    checkpoints = []
+    for name in os.listdir(CHECKPOINT_DIR):
+        match = re.fullmatch(r"i=(\d+)\.bin", name)
+        if match:
+            checkpoints.append((int(match.group(1)), os.path.getsize(os.path.join(CHECKPOINT_DIR, name))))
+    total = sum(size for _, size in checkpoints)
+    if total <= max_bytes:
+        return
+    highest = max(index for index, _ in checkpoints)
+
+    def level(index):
+        multiple = index // CHECKPOINT_STRIDE
+        return (multiple & -multiple).bit_length()
+
+    evicted = 0
+    for index, size in sorted(checkpoints, key=lambda checkpoint: (level(checkpoint[0]), checkpoint[0])):
+        if total <= max_bytes:
+            break
+        if index != highest:
+            os.remove(checkpoint_path(index))
+            total -= size
+            evicted += 1
+    logger.info(f"斐波那契检查点超出 {max_bytes / 2 ** 20:.0f} MB 的预算，删除了 {evicted} 个，剩余 {total / 2 ** 20:.0f} MB")
+
+
+def calculate_batch_step(start_index, batch_size):
+    """只在批次开头播种一次（从检查点推进或快速倍增），之后每一项都用Q^12向前推进"""
+    results = [0] * batch_size
+    fib1, fib2 = seed_pair(start_index)
+    for i in range(batch_size):
+        index = start_index + i
+        if i:
+            fib1, fib2 = step_pair(fib1, fib2)
+        results[i] = calculate_2adic(index, fib1, fib2)
+    return results
+
+
+MOD_BITS = 64  # 截断模式下的初始精度K
+
+
+def fibonacci_pair_mod(n, bits):
+    """快速倍增算法的截断版本，返回 (F(n) mod 2^bits, F(n+1) mod 2^bits)"""
+    mask = (1 << bits) - 1
+    a, b = gmpy2.mpz(0), gmpy2.mpz(1)
+    for bit in bin(n)[2:] if n > 0 else "":
+        c = gmpy2.mul(a, 2 * b - a) & mask
+        d = (gmpy2.mul(a, a) + gmpy2.mul(b, b)) & mask
+        a, b = (d, (c + d) & mask) if bit == "1" else (c, d)
+    return a, b
+
+
+def calculate_2adic_mod(index, bits=MOD_BITS):
+    """
+    只在模2^K下计算Ln的2-adic，余数为0时把K翻倍重新计算
+
+    Ln = ((4k-1) * F(k) + 2k * F(k+1)) / 5，其中分子恰好能被5整除
+    5是奇数（在模2^K下可逆），除以5不会改变2-adic，所以直接看分子的低K位即可
+    只要分子模2^K不为0，它的最低位1就是Ln的2-adic
+    K超过Ln本身的位数时余数仍为0，说明这里有问题，交给完整精度的算法处理
+    """
+    k = 12 * index + 3
+    while bits <= 2 * k + 64:
+        fib1, fib2 = fibonacci_pair_mod(k, bits)
+        residue = ((4 * k - 1) * fib1 + 2 * k * fib2) & ((1 << bits) - 1)
+        if residue:
+            return gmpy2.bit_scan1(residue)
+        bits *= 2
+    return calculate_2adic(index, *fibonacci_pair(k))
+
+
+def calculate_batch_mod(start_index, batch_size):
+    """在模2^K下用Q^12向前推进，每一项的内存和时间都只和K有关，与项数无关"""
+    results = [0] * batch_size
+    mask = (1 << MOD_BITS) - 1
+    fib1, fib2 = fibonacci_pair_mod(12 * start_index + 3, MOD_BITS)
+    for i in range(batch_size):
+        index = start_index + i
+        if i:
+            fib1, fib2 = step_pair(fib1, fib2)
+            fib1, fib2 = fib1 & mask, fib2 & mask
+        k = 12 * index + 3
+        residue = ((4 * k - 1) * fib1 + 2 * k * fib2) & mask
+        if residue:
+            results[i] = gmpy2.bit_scan1(residue)
+        else:
+            results[i] = calculate_2adic_mod(index, MOD_BITS * 2)  # 精度不够，单独提高精度
+    return results
+
+
+def fibonacci_pair_uint64(ns):
+    """
+    快速倍增算法的向量化版本，对一整个数组的n同时计算 (F(n) mod 2^64, F(n+1) mod 2^64)
+
+    uint64数组的乘法和加减法溢出时会自动回绕，正好就是模2^64运算
+    所有n从最大值的最高位开始一起处理，较小的n高位是0，倍增 (F(0), F(1)) 仍然是它自己，不影响结果
+    """
+    a = np.zeros(len(ns), dtype=np.uint64)
+    b = np.ones(len(ns), dtype=np.uint64)
+    if not len(ns):
+        return a, b  # 空数组没有最大值
+    two = np.uint64(2)
+    for shift in range(int(ns.max()).bit_length() - 1, -1, -1):
+        c = a * (two * b - a)
+        d = a * a + b * b
+        bit = ((ns >> np.uint64(shift)) & np.uint64(1)).astype(bool)
+        a, b = np.where(bit, d, c), np.where(bit, c + d, d)
+    return a, b
+
+
+def calculate_batch_numpy(start_index, batch_size):
+    """用uint64数组一次算完整批的模2^64余数，余数为0的项再交给gmpy2处理"""
+    if 12 * (start_index + batch_size) + 3 >= 2 ** 64:  # k已经放不进uint64了
+        return calculate_batch_mod(start_index, batch_size)
+    indices = np.arange(start_index, start_index + batch_size, dtype=np.uint64)
+    k = np.uint64(12) * indices + np.uint64(3)
+    fib1, fib2 = fibonacci_pair_uint64(k)
+    residue = (np.uint64(4) * k - np.uint64(1)) * fib1 + np.uint64(2) * k * fib2
+    lowest_bit = residue & (~residue + np.uint64(1))  # 只保留最低位的1
+    results = np.zeros(batch_size, dtype=np.int64)
+    nonzero = residue != 0
+    results[nonzero] = np.log2(lowest_bit[nonzero]).astype(np.int64)  # 2的幂在float64中是精确的
+    for i in np.flatnonzero(~nonzero):
+        results[i] = calculate_2adic_mod(start_index + int(i), 128)
+    return results.tolist()
+
+
+PISANO_BITS = 24  # 周期表的精度K，表长为2^(K-3)，K=24时约2MB
+pisano_tables = {}
+
+
+def pisano_period(bits):
+    """
+    Ln的分子模2^K关于index的周期
+
+    斐波那契数列模2^K的周期（Pisano周期）是3 * 2^(K-1)，k每次加12，所以F(k)关于index的周期是2^(K-3)
+    系数4k-1 = 48 * index + 11和2k = 24 * index + 6模2^K的周期分别是2^(K-4)和2^(K-3)
+    所以整个分子模2^K关于index的周期是2^(K-3)
+    """
+    return 1 << (bits - 3)
+
+
+def build_pisano_table(bits, chunk_size=1 << 16):
+    """
+    计算一个周期内每一项的2-adic，分子模2^K为0的位置记为K（表示2-adic至少为K，需要回退）
+    """
+    mask = np.uint64((1 << bits) - 1)
+    period = pisano_period(bits)
+    table = np.empty(period, dtype=np.uint8)
+    for start in range(0, period, chunk_size):
+        indices = np.arange(start, min(start + chunk_size, period), dtype=np.uint64)
+        k = np.uint64(12) * indices + np.uint64(3)
+        fib1, fib2 = fibonacci_pair_uint64(k)
+        residue = ((np.uint64(4) * k - np.uint64(1)) * fib1 + np.uint64(2) * k * fib2) & mask
+        lowest_bit = residue & (~residue + np.uint64(1))
+        values = np.full(len(indices), bits, dtype=np.uint8)
+        nonzero = residue != 0
+        values[nonzero] = np.log2(lowest_bit[nonzero]).astype(np.uint8)
+        table[start:start + len(indices)] = values
+    return table
+
+
+def load_pisano_table(bits=PISANO_BITS):
+    """
+    读取周期表，不存在时计算并保存到 pisano_K={bits}.npy
+
+    先写到临时文件再 os.replace，中断或多个进程同时保存时也不会留下写了一半的表
+    旧版本留下的不完整的表读不出来时，同样重新计算
+    """
+    if bits not in pisano_tables:
+        file_path = f"pisano_K={bits}.npy"
+        try:
+            table = np.load(file_path, mmap_mode="r")  # 用内存映射打开，不需要整个读入内存
+        except (FileNotFoundError, ValueError):
+            logger.info(f"未找到可用的周期表 {file_path}，正在计算 {pisano_period(bits)} 项...")
+            with open(f"{file_path}.{os.getpid()}.tmp", "wb") as f:
+                np.save(f, build_pisano_table(bits))
+            os.replace(f"{file_path}.{os.getpid()}.tmp", file_path)
+            table = np.load(file_path, mmap_mode="r")
+        pisano_tables[bits] = table  # 用内存映射打开，不需要整个读入内存
+    return pisano_tables[bits]
+
+
+def lookup_2adic(index, bits=PISANO_BITS):
+    """随机访问第index项：2-adic小于K时直接查表，否则回退到截断算法"""
+    result = int(load_pisano_table(bits)[index % pisano_period(bits)])
+    if result < bits:
+        return result
+    return calculate_2adic_mod(index, max(MOD_BITS, 2 * bits))
+
+
+def calculate_batch_pisano(start_index, batch_size):
+    """整批查周期表，只有查不到的项才需要计算"""
+    table = load_pisano_table(PISANO_BITS)
+    positions = np.arange(start_index, start_index + batch_size, dtype=object) % pisano_period(PISANO_BITS)
+    results = table[positions.astype(np.int64)].astype(np.int64)
+    for i in np.flatnonzero(results >= PISANO_BITS):
+        results[i] = calculate_2adic_mod(start_index + int(i), max(MOD_BITS, 2 * PISANO_BITS))
+    return results.tolist()
+
+
+def find_2adic_root(bits=PISANO_BITS):
+    """
+    从周期表中找出数列的2-adic"根"c和基准值base，使得 2-adic(index) = base + v2(index - c)
+
+    周期表里只有一个位置是K（2-adic至少为K），那就是 c mod 2^(K-3)
+    然后把整张表和公式逐项比对，一个周期内全部相同才返回
+    由于分子模2^K关于index以2^(K-3)为周期，比对通过就说明公式对所有2-adic小于K的项都成立
+    """
+    table = load_pisano_table(bits)
+    period = pisano_period(bits)
+    roots = np.flatnonzero(table >= bits)
+    if len(roots) != 1:
+        return None
+    root = int(roots[0])
+    base = int(table[(root + 1) % period])
+    offsets = (np.arange(period, dtype=np.uint64) - np.uint64(root)) & np.uint64(period - 1)
+    lowest_bit = offsets & (~offsets + np.uint64(1))
+    expected = np.full(period, bits, dtype=np.int64)
+    nonzero = offsets != 0
+    expected[nonzero] = base + np.log2(lowest_bit[nonzero]).astype(np.int64)
+    if not np.array_equal(expected, table.astype(np.int64)):
+        return None
+    return root, base
+
+
+two_adic_roots = {}
+
+
+def classify_2adic(index, bits=PISANO_BITS):
+    """
+    不计算斐波那契数，直接由闭式给出第index项的2-adic，给不出时返回None
+
+    Ln的分子是 (4k-1) * F(k) + 2k * F(k+1)，由斐波那契数的2-adic的闭式（Lengyel）：
+    n不是3的倍数时 F(n) 是奇数，n ≡ 3 (mod 6) 时 v2(F(n)) = 1，n ≡ 0 (mod 6) 时为 v2(n) + 2
+    k = 12 * index + 3 是奇数且 k ≡ 3 (mod 6)，所以 v2((4k-1) * F(k)) = 0 + 1
+    k+1 ≡ 4 (mod 12) 不是3的倍数，所以 v2(2k * F(k+1)) = 1 + 0
+    两项的2-adic恒为1、总是相互抵消，逐项比较得不出结果，所以直接用 find_2adic_root 得到的 base + v2(index - c)
+    只有 index ≡ c (mod 2^(K-3)) 时给不出
+    """
+    if bits not in two_adic_roots:
+        two_adic_roots[bits] = find_2adic_root(bits)
+    if two_adic_roots[bits] is None:
+        return None
+    root, base = two_adic_roots[bits]
+    offset = (index - root) % pisano_period(bits)
+    return base + gmpy2.bit_scan1(offset) if offset else None
+
+
+analytic_terms = 0  # 本进程中由闭式直接得出的项数，随任务的完成通知汇总到主进程
+
+
+def calculate_batch_theorem(start_index, batch_size):
+    """能由闭式给出的项直接给出，真正相互抵消的项才交给 calculate_2adic_mod 精确计算"""
+    global analytic_terms
+    results = [0] * batch_size
+    for i in range(batch_size):
+        index = start_index + i
+        result = classify_2adic(index)
+        if result is None:
+            result = calculate_2adic_mod(index, max(MOD_BITS, 2 * PISANO_BITS))
+        else:
+            analytic_terms += 1
+        results[i] = result
+    return results
+
+
+def calculate_batch_cython(start_index, batch_size):
+    """整批交给编译好的 cython_2adic，计算时释放GIL"""
+    if cython_2adic is None:
+        raise RuntimeError("未找到 cython_2adic 模块，请先在 cython 目录下运行 python setup.py build_ext --inplace")
+    results = cython_2adic.calculate_batch(start_index, batch_size)
+    return results
+
+
+BATCH_ENGINES = {
+    "doubling": calculate_batch_doubling,
+    "xmpz": calculate_batch_xmpz,
+    "step": calculate_batch_step,
+    "mod": calculate_batch_mod,
+    "numpy": calculate_batch_numpy,
+    "pisano": calculate_batch_pisano,
+    "theorem": calculate_batch_theorem,
+    "cython": calculate_batch_cython,
+}
+DEFAULT_MODE = "step"
+NOGIL_MODES = {"cython"}  # 计算时释放GIL的模式，用线程池即可跑满所有核心，不需要进程间传输数据
+PARTITION_MODES = {"step", "cython"}  # "播种一次、之后推进"的模式，只有它们能按 partition 切分
+PISANO_MODES = {"pisano", "theorem"}  # 需要周期表的模式
+
+
+def prepare_mode(mode):
+    """创建进程池之前在主进程中做好各个模式共用的准备，比如只由主进程计算并保存一次周期表"""
+    if mode in PISANO_MODES:
+        load_pisano_table(PISANO_BITS)
+
+
+TERM_LOG_EVERY = 0  # 每隔多少项输出一次单项的结果：1为每一项都输出，0为不输出，只由主进程定期汇总进度
+term_logger = logging.getLogger("terms")
+
+
+def log_terms(start_index, results):
+    """按 TERM_LOG_EVERY 抽样输出一批结果中的单项，不输出时连字符串都不格式化"""
+    if not TERM_LOG_EVERY or not term_logger.isEnabledFor(logging.INFO):
+        return
+    for i in range(-start_index % TERM_LOG_EVERY, len(results), TERM_LOG_EVERY):
+        term_logger.info(f"第 {start_index + i + 1} 个数的 2-adic 为：{results[i]}")
+
+
+def calculate_batch(start_index, batch_size, mode=DEFAULT_MODE):
+    """计算一批2-adic数，batch_size 和计算模式 mode 作为参数传递"""
+    if mode not in BATCH_ENGINES:
+        raise ValueError(f"未知的计算模式：{mode}，可选：{', '.join(BATCH_ENGINES)}")
+    results = BATCH_ENGINES[mode](start_index, batch_size)
+    log_terms(start_index, results)
+    logger.debug(f"进程 {os.getpid()} 的推进矩阵缓存统计：{jump_cache.stats()}")
+    return results
+
+
+def extend_step_ladder(ladder, max_distance):
+    """把共享的阶梯 [Q^12, Q^24, Q^48, ...]（第j级是Q^(12 * 2^j)）按需加长，直到能覆盖 max_distance 为止"""
+    while 1 << len(ladder) <= max_distance:
+        ladder.append(matrix_multiply(ladder[-1], ladder[-1]))
+    return ladder
+
+
+def calculate_sparse(indices):
+    """
+    计算任意一组（稀疏的）项，返回 {index: 2-adic}
+
+    先对最小的项播种一次（seed_pair，只读已有的检查点，查询不会写文件），之后按从小到大的顺序，用相邻两项的间隔d把 (F(k), F(k+1)) 推进到下一项
+    推进用的Q^(12d)由共享阶梯中对应d的二进制位的各级相乘得到，并按d存入 jump_cache，之后的查询也能直接用
+    阶梯只在 jump_cache 中没有这个d时才加长，所有间隔都已缓存时一级也不用算
+    比如每隔x项取一项时，间隔都相同，整组只需要构造一次Q^(12x)，之后每一项都只是一次矩阵乘向量
+    """
+    indices = sorted(set(indices))
+    if not indices:
+        return {}
+    gaps = [current - previous for previous, current in zip(indices, indices[1:])]
+    ladder = [STEP_MATRIX]
+    results = {}
+    fib1, fib2 = seed_pair(indices[0], save=False)
+    for i, index in enumerate(indices):
+        if i:
+            gap = gaps[i - 1]
+            matrix = jump_cache.get(gap)
+            if matrix is None:
+                extend_step_ladder(ladder, gap)
+                for j in range(gap.bit_length()):
+                    if gap >> j & 1:
+                        matrix = ladder[j] if matrix is None else matrix_multiply(matrix, ladder[j])
+                jump_cache.put(gap, matrix)
+            fib1, fib2 = step_pair(fib1, fib2, matrix)
+        results[index] = calculate_2adic(index, fib1, fib2)
+        log_terms(index, [results[index]])
+    return results
+
+
+RESULT_MAGIC = b"2ADICVAL"
+RESULT_VERSION = 1
+RESULT_HEADER = struct.Struct("<8sHHH4sQ")  # 魔数、版本、公式 k = 12i+3 的两个参数、数据类型、项数
+RESULT_HEADER_SIZE = 64  # 头部补齐到64字节，数据从这里开始
+RESULT_DTYPE = np.dtype(np.uint8)  # 2-adic只随index按对数增长，index < 2^250 时都放得进一个字节
+COPY_CHUNK = 1 << 24  # 复制、导入、导出时每次处理的项数
+
+
+def write_results_header(file, count, dtype=RESULT_DTYPE):
+    """写入（或改写）结果文件的头部"""
+    file.seek(0)
+    header = RESULT_HEADER.pack(RESULT_MAGIC, RESULT_VERSION, 12, 3, dtype.str.encode(), count)
+    file.write(header.ljust(RESULT_HEADER_SIZE, b"\0"))
+
+
+def read_results_header(file_path):
+    """检查结果文件的头部，返回 (数据类型, 项数)"""
+    with open(file_path, "rb") as f:
+        header = f.read(RESULT_HEADER.size)
+    if len(header) < RESULT_HEADER.size or not header.startswith(RESULT_MAGIC):
+        raise ValueError(f"{file_path} 不是结果文件")
+    _, version, multiplier, offset, dtype, count = RESULT_HEADER.unpack(header)
+    if version != RESULT_VERSION:
+        raise ValueError(f"{file_path} 的版本为 {version}，本脚本只支持版本 {RESULT_VERSION}")
+    if (multiplier, offset) != (12, 3):
+        raise ValueError(f"{file_path} 是 k = {multiplier}i+{offset} 的结果，与本脚本的 k = 12i+3 不符")
+    return np.dtype(dtype.rstrip(b"\0").decode()), count
+
+
+def open_results(file_path, count=None):
+    """以memmap只读打开结果文件，不解析也不读入内存，打开的耗时与文件大小无关；count 为只打开前多少项"""
+    dtype, header_count = read_results_header(file_path)
+    count = header_count if count is None else count
+    if not count:
+        return np.zeros(0, dtype=dtype)  # 长度为0的memmap会报错
+    return np.memmap(file_path, dtype=dtype, mode="r", offset=RESULT_HEADER_SIZE, shape=(count,))
+
+
+def append_results(file, results, checksum=0):
+    """把一段结果按 RESULT_DTYPE 追加写入，大数组分块转换，不会整个复制一遍；返回累计的CRC32"""
+    for i in range(0, len(results), COPY_CHUNK):
+        data = np.ascontiguousarray(results[i:i + COPY_CHUNK], dtype=RESULT_DTYPE).tobytes()
+        file.write(data)
+        checksum = zlib.crc32(data, checksum)
+    return checksum
+
+
+def write_results(file_path, results):
+    """写入结果到文件，并登记到结果目录中"""
+    with open(file_path, "wb", buffering=1024 * 1024) as f:  # 使用1MB的缓冲区
+        write_results_header(f, len(results))
+        checksum = append_results(f, results)
+    Catalog().record(file_path, "bin", len(results), checksum)
+
+
+def import_text_results(text_path, file_path=None):
+    """把旧版的文本结果（空格分隔的十进制数）转换为二进制结果文件，返回新文件名；文本按块读取"""
+    file_path = file_path or os.path.splitext(text_path)[0] + ".bin"
+    count = 0
+    checksum = 0
+    rest = ""
+    with open(text_path, "r") as src, open(file_path + ".part", "wb") as dst:
+        write_results_header(dst, 0)
+        dst.seek(RESULT_HEADER_SIZE)
+        while True:
+            chunk = src.read(COPY_CHUNK)
+            tokens = (rest + chunk).split()
+            rest = tokens.pop() if chunk and tokens and not chunk[-1].isspace() else ""  # 块末尾的数可能被截断
+            values = np.array(tokens, dtype=np.int64)
+            if len(values) and values.max() > np.iinfo(RESULT_DTYPE).max:
+                raise ValueError(f"{text_path} 中有超出 {RESULT_DTYPE} 范围的数")
+            checksum = append_results(dst, values, checksum)
+            count += len(values)
+            if not chunk:
+                break
+        write_results_header(dst, count)
+    os.replace(file_path + ".part", file_path)
+    Catalog().record(file_path, "bin", count, checksum)
+    return file_path
+
+
+def export_text_results(file_path, text_path=None):
+    """把二进制结果文件导出为旧版的文本格式，返回文本文件名"""
+    text_path = text_path or os.path.splitext(file_path)[0] + ".txt"
+    results = open_results(file_path)
+    checksum = 0
+    with open(text_path, "w", buffering=1024 * 1024) as f:
+        for i in range(0, len(results), COPY_CHUNK):
+            text = (" " if i else "") + " ".join(map(str, results[i:i + COPY_CHUNK].tolist()))
+            f.write(text)
+            checksum = zlib.crc32(text.encode(), checksum)
+    Catalog().record(text_path, "txt", len(results), checksum)
+    return text_path
+
+
+RESULT_LOG = "output_results.bin"
+COMMIT_MAGIC = b"2ADICCMT"
+COMMIT_HEADER = struct.Struct("<8sQ")  # 魔数、段数
+SEGMENT_RECORD = struct.Struct("<QQI")  # 每一段的起始项、项数、数据的CRC32
+
+
+class ResultLog:
+    """
+    只追加的结果文件
+
+    数据部分与 write_results 写出的格式相同，可以直接memmap；每次运行追加的一段称为一个段
+    各段的 (起始项, 项数, CRC32) 记在旁边的 .commit 文件中，它经 os.replace 原子地替换，替换完成才算提交
+    打开时只读 .commit 文件，不读已有的数据；上次追加了一半、没有提交的部分在下次追加前截掉
+    这样从n扩展到n+Δ只写Δ项，也不会留下一个比一个大的重复文件
+    .commit 文件丢失时（比如只复制了结果文件），按头部中的项数重建为一段，头部中的项数总是已经提交的
+    """
+
+    def __init__(self, path=RESULT_LOG):
+        self.path = path
+        self.commit_path = path + ".commit"
+        self.segments = self.read_commit()
+        self.count = self.segments[-1][0] + self.segments[-1][1] if self.segments else 0
+        if self.count and os.path.getsize(path) < RESULT_HEADER_SIZE + self.count * RESULT_DTYPE.itemsize:
+            raise ValueError(f"{path} 比 {self.commit_path} 中记录的 {self.count} 项短，文件已损坏")
+        self.file = None
+
+    def read_commit(self):
+        if not os.path.exists(self.commit_path):
+            return self.recover_commit()
+        with open(self.commit_path, "rb") as f:
+            magic, segment_count = COMMIT_HEADER.unpack(f.read(COMMIT_HEADER.size))
+            if magic != COMMIT_MAGIC:
+                raise ValueError(f"{self.commit_path} 不是提交记录文件")
+            return [SEGMENT_RECORD.unpack(f.read(SEGMENT_RECORD.size)) for _ in range(segment_count)]
+
+    def recover_commit(self):
+        """没有 .commit 文件时，把头部记录的前若干项作为一段重新提交"""
+        if not os.path.exists(self.path):
+            return []
+        _, count = read_results_header(self.path)
+        if not count:
+            return []
+        if os.path.getsize(self.path) < RESULT_HEADER_SIZE + count * RESULT_DTYPE.itemsize:
+            raise ValueError(f"{self.path} 比头部中记录的 {count} 项短，文件已损坏")
+        self.segments = [(0, count, file_checksum(self.path, RESULT_HEADER_SIZE, count * RESULT_DTYPE.itemsize))]
+        self.write_commit()
+        logger.info(f"未找到 {self.commit_path}，已按 {self.path} 头部中的 {count} 项重建。")
+        return self.segments
+
+    def write_commit(self):
+        with open(self.commit_path + ".tmp", "wb") as f:
+            f.write(COMMIT_HEADER.pack(COMMIT_MAGIC, len(self.segments)))
+            for segment in self.segments:
+                f.write(SEGMENT_RECORD.pack(*segment))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.commit_path + ".tmp", self.commit_path)
+
+    def open_results(self):
+        """memmap只读打开已提交的部分"""
+        if not self.count:
+            return np.zeros(0, dtype=RESULT_DTYPE)
+        return open_results(self.path, self.count)
+
+    def begin(self):
+        """
+        开始追加新的一段，返回自己，可以当作文件传给 append_results
+
+        第一次追加时先建立只有头部的空文件和没有任何段的 .commit 文件，这时还不登记到结果目录，提交了结果才登记
+        这样第一次运行一项都没算完就中断或出错时，下次打开的仍是一个有提交记录的空日志
+        """
+        if not os.path.exists(self.path):
+            with open(self.path, "wb") as f:
+                write_results_header(f, 0)
+            self.write_commit()
+        _, header_count = read_results_header(self.path)
+        if header_count > self.count:
+            raise ValueError(f"{self.path} 的头部记录了 {header_count} 项，但 {self.commit_path} 中只提交了 {self.count} 项，"
+                             f"为避免截掉已有的结果，请先检查这两个文件")
+        self.file = open(self.path, "r+b", buffering=1024 * 1024)
+        self.file.truncate(RESULT_HEADER_SIZE + self.count * RESULT_DTYPE.itemsize)  # 截掉上次没有提交的部分
+        self.file.seek(0, os.SEEK_END)
+        self.crc = 0
+        self.written = 0
+        return self
+
+    def write(self, data):
+        self.file.write(data)
+        self.crc = zlib.crc32(data, self.crc)
+        self.written += len(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def commit(self):
+        """先把新的一段落盘，再替换 .commit 文件，最后更新头部中的项数，返回提交后的总项数"""
+        count = self.written // RESULT_DTYPE.itemsize
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        if count:
+            self.segments.append((self.count, count, self.crc))
+            self.write_commit()
+            self.count += count
+        write_results_header(self.file, self.count)  # 头部落后于 .commit 时，只读头部的工具看到的仍是完整的前缀
+        self.file.close()
+        self.file = None
+        if count:
+            with open(self.commit_path, "rb") as f:
+                Catalog().record(self.path, "log", self.count, zlib.crc32(f.read()))  # 各段的CRC32都在 .commit 中
+        return self.count
+
+    def verify(self):
+        """逐段核对CRC32，返回校验不通过的段"""
+        results = self.open_results()
+        bad = []
+        for start, count, crc in self.segments:
+            checksum = 0
+            for i in range(start, start + count, COPY_CHUNK):
+                checksum = zlib.crc32(results[i:min(i + COPY_CHUNK, start + count)], checksum)
+            if checksum != crc:
+                bad.append((start, count))
+        return bad
+
+
+CATALOG_PATH = "output_catalog.json"
+FORMULA_KEY = "k=12i+3"  # 目录中按公式区分不同的结果
+FORMAT_RANK = {"txt": 0, "bin": 1, "log": 2}  # 可以作为最新结果的格式，项数相同时优先使用排在后面的
+
+
+def file_checksum(file_path, offset=0, length=None):
+    """分块计算文件从offset开始的CRC32，length 为只计算多少字节，默认到文件末尾"""
+    checksum = 0
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        while chunk := f.read(COPY_CHUNK if length is None else min(COPY_CHUNK, length)):
+            checksum = zlib.crc32(chunk, checksum)
+            if length is not None:
+                length -= len(chunk)
+    return checksum
+
+
+class Catalog:
+    """
+    结果目录 output_catalog.json，取代每次都 os.listdir 再用正则匹配所有文件名的 get_latest_file_path
+
+    每个结果文件一条记录：格式（log / bin / txt）、范围 [0, end)、公式参数、校验和、提交时的字节数
+    另外按公式记下项数最多的文件，查找最新的结果只需读这一个小文件，与目录中有多少文件无关
+    查找时会核对文件还在、大小与记录相符，不再只凭文件名中的n就相信它的内容
+    目录文件还不存在时（旧的工作目录），扫描一次已有的结果文件建立目录
+    """
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.artifacts = data["artifacts"]
+            self.latest_by_formula = data["latest"]
+        else:
+            self.artifacts = {}
+            self.latest_by_formula = {}
+            self.rebuild()
+
+    def save(self):
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "artifacts": self.artifacts, "latest": self.latest_by_formula}, f,
+                      ensure_ascii=False, indent=1)
+        os.replace(self.path + ".tmp", self.path)
+
+    def record(self, file_path, file_format, end, checksum, save=True):
+        """登记（或更新）一个结果文件，项数最多的文件成为最新的结果，项数相同时按 FORMAT_RANK 优先"""
+        self.artifacts[file_path] = {
+            "format": file_format, "start": 0, "end": end, "params": [12, 3],
+            "checksum": f"crc32:{checksum:08x}", "bytes": os.path.getsize(file_path),
+        }
+        latest = self.artifacts.get(self.latest_by_formula.get(FORMULA_KEY))
+        if file_format not in FORMAT_RANK:
+            pass  # 压缩归档只登记，不作为续算和各个工具的输入
+        elif latest is None or (end, FORMAT_RANK[file_format]) >= (latest["end"], FORMAT_RANK[latest["format"]]):
+            self.latest_by_formula[FORMULA_KEY] = file_path
+        if save:
+            self.save()
+
+    def is_valid(self, file_path):
+        entry = self.artifacts[file_path]
+        if not os.path.exists(file_path):
+            return False
+        size = os.path.getsize(file_path)
+        return size >= entry["bytes"] if entry["format"] == "log" else size == entry["bytes"]  # 结果日志末尾可能有未提交的部分
+
+    def latest(self):
+        """返回最新的结果文件；记录的文件已被删除或改动时，把它移出目录，改用剩下的项数最多的文件"""
+        while True:
+            file_path = self.latest_by_formula.get(FORMULA_KEY)
+            if file_path is None or self.is_valid(file_path):
+                return file_path
+            logger.info(f"结果目录中的 {file_path} 已不存在或大小与记录不符，已从目录中移除。")
+            del self.artifacts[file_path]
+            candidates = [(entry["end"], FORMAT_RANK[entry["format"]], name) for name, entry in self.artifacts.items()
+                          if entry["params"] == [12, 3] and entry["format"] in FORMAT_RANK]
+            self.latest_by_formula[FORMULA_KEY] = max(candidates)[2] if candidates else None
+            self.save()
+
+    def rebuild(self):
+        """扫描一次工作目录，登记已有的结果文件"""
+        for name in os.listdir("."):
+            if name == RESULT_LOG:
+                try:
+                    log = ResultLog(name)  # 没有 .commit 文件时会按头部重建
+                except ValueError:
+                    continue
+                if log.count:
+                    self.record(name, "log", log.count, file_checksum(log.commit_path), save=False)
+            elif re.fullmatch(r"output_n=\d+\.bin", name):
+                try:
+                    _, count = read_results_header(name)
+                except ValueError:
+                    continue
+                self.record(name, "bin", count, file_checksum(name, RESULT_HEADER_SIZE), save=False)
+            elif re.fullmatch(r"output_n=\d+\.txt", name):
+                checksum, separators = 0, 0
+                with open(name, "rb") as f:
+                    while chunk := f.read(COPY_CHUNK):  # 只数分隔符，不解析数字，项数以内容为准而不是文件名
+                        checksum = zlib.crc32(chunk, checksum)
+                        separators += chunk.count(b" ")
+                count = separators + 1 if os.path.getsize(name) else 0
+                self.record(name, "txt", count, checksum, save=False)
+        if self.artifacts:
+            logger.info(f"已建立结果目录 {self.path}，登记了 {len(self.artifacts)} 个结果文件。")
+        self.save()
+
+
+COMPRESSED_PATH = "output_results.blk"
+BLOCK_MAGIC = b"2ADICBLK"
+BLOCK_VERSION = 1
+BLOCK_HEADER = struct.Struct("<8sHHHIQQ")  # 魔数、版本、公式的两个参数、每块项数、总项数、块数；之后是块索引
+BLOCK_SIZE = 4096  # 每块的项数，块内的位置用uint16记录，不能超过65536
+BLOCK_BITPACKED, BLOCK_PERIODIC = 0, 1
+BITPACK_HEADER = struct.Struct("<BB")  # 最小值、每项的位数
+PERIODIC_HEADER = struct.Struct("<BHH")  # 编码方式、周期、例外的个数
+
+
+def encode_bitpacked(values):
+    """减去最小值后，每项只用刚好够用的位数"""
+    base = int(values.min()) if len(values) else 0
+    width = (int(values.max()) - base).bit_length() if len(values) else 0
+    header = BITPACK_HEADER.pack(base, width)
+    if not width:
+        return header
+    bits = ((values - base).astype(np.uint8)[:, None] >> np.arange(width, dtype=np.uint8)) & 1
+    return header + np.packbits(bits.ravel()).tobytes()
+
+
+def decode_bitpacked(data, offset, count):
+    """返回解出的count项和下一段数据的位置"""
+    base, width = BITPACK_HEADER.unpack_from(data, offset)
+    offset += BITPACK_HEADER.size
+    if not width:
+        return np.full(count, base, dtype=RESULT_DTYPE), offset
+    size = (count * width + 7) // 8
+    bits = np.unpackbits(np.frombuffer(data, np.uint8, size, offset))[:count * width].reshape(count, width)
+    values = (bits << np.arange(width, dtype=np.uint8)).sum(axis=1, dtype=np.uint8) + np.uint8(base)
+    return values.astype(RESULT_DTYPE), offset + size
+
+
+def encode_block(values):
+    """
+    压缩一块，在下面两种编码中取最短的：
+    直接按位压缩；
+    周期编码：v(i) = 3 + v2(i - c)，所以除了 i ≡ c (mod p) 的少数位置之外，整块就是以p为周期重复的一段模板
+    对每个2的幂p，模板取每个余数位置上出现最多的值，与模板不符的位置和值作为例外另外记录；p = 1 就是游程编码
+    """
+    candidates = [bytes([BLOCK_BITPACKED]) + encode_bitpacked(values)]
+    residues = np.arange(len(values))
+    period = 1
+    while period <= len(values) // 4:
+        counts = np.zeros((period, int(values.max()) + 1), dtype=np.int32)
+        np.add.at(counts, (residues % period, values), 1)
+        template = counts.argmax(axis=1).astype(RESULT_DTYPE)
+        positions = np.flatnonzero(values != np.resize(template, len(values))).astype(np.uint16)
+        candidates.append(PERIODIC_HEADER.pack(BLOCK_PERIODIC, period, len(positions)) + encode_bitpacked(template)
+                          + positions.tobytes() + values[positions].astype(RESULT_DTYPE).tobytes())
+        period *= 2
+    return min(candidates, key=len)
+
+
+def decode_block(data, count):
+    if data[0] == BLOCK_BITPACKED:
+        return decode_bitpacked(data, 1, count)[0]
+    _, period, exceptions = PERIODIC_HEADER.unpack_from(data)
+    template, offset = decode_bitpacked(data, PERIODIC_HEADER.size, period)
+    values = np.resize(template, count)
+    positions = np.frombuffer(data, np.uint16, exceptions, offset)
+    values[positions] = np.frombuffer(data, RESULT_DTYPE, exceptions, offset + 2 * exceptions)
+    return values
+
+
+def compress_results(file_path=RESULT_LOG, compressed_path=COMPRESSED_PATH):
+    """把结果按块压缩成可以随机访问的归档，返回 (归档文件名, 压缩比)"""
+    results = ResultLog(file_path).open_results() if file_path == RESULT_LOG else open_results(file_path)
+    block_count = -(-len(results) // BLOCK_SIZE)
+    offsets = np.zeros(block_count + 1, dtype="<u8")
+    with open(compressed_path + ".part", "wb") as f:
+        f.write(BLOCK_HEADER.pack(BLOCK_MAGIC, BLOCK_VERSION, 12, 3, BLOCK_SIZE, len(results), block_count))
+        f.write(offsets.tobytes())  # 块索引先占位，写完所有块再回填
+        offsets[0] = f.tell()
+        for b in range(block_count):
+            f.write(encode_block(np.asarray(results[b * BLOCK_SIZE:(b + 1) * BLOCK_SIZE])))
+            offsets[b + 1] = f.tell()
+        f.seek(BLOCK_HEADER.size)
+        f.write(offsets.tobytes())
+    os.replace(compressed_path + ".part", compressed_path)
+    Catalog().record(compressed_path, "blk", len(results), file_checksum(compressed_path))
+    return compressed_path, len(results) * RESULT_DTYPE.itemsize / max(os.path.getsize(compressed_path), 1)
+
+
+class CompressedResults:
+    """
+    按块压缩的只读结果，memmap打开，用法与数组相同：len(results)、results[i]、results[a:b]
+
+    块索引记录每一块在文件中的位置，取第i项只需解压第 i // BLOCK_SIZE 块，取一段也只解压它覆盖的块
+    """
+
+    def __init__(self, file_path=COMPRESSED_PATH):
+        self.data = np.memmap(file_path, dtype=np.uint8, mode="r")
+        magic, version, multiplier, offset, self.block_size, self.count, block_count = BLOCK_HEADER.unpack_from(self.data)
+        if magic != BLOCK_MAGIC or version != BLOCK_VERSION:
+            raise ValueError(f"{file_path} 不是版本 {BLOCK_VERSION} 的压缩结果文件")
+        if (multiplier, offset) != (12, 3):
+            raise ValueError(f"{file_path} 是 k = {multiplier}i+{offset} 的结果，与本脚本的 k = 12i+3 不符")
+        self.offsets = np.frombuffer(self.data, "<u8", block_count + 1, BLOCK_HEADER.size)
+        self.cached_block = (None, None)  # 最近解压的一块，逐项顺序访问时不必重复解压
+
+    def __len__(self):
+        return self.count
+
+    def block(self, b):
+        if self.cached_block[0] != b:
+            count = min(self.block_size, self.count - b * self.block_size)
+            self.cached_block = (b, decode_block(self.data[self.offsets[b]:self.offsets[b + 1]], count))
+        return self.cached_block[1]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.count)
+            if start >= stop:
+                return np.zeros(0, dtype=RESULT_DTYPE)
+            first, last = start // self.block_size, (stop - 1) // self.block_size
+            values = np.concatenate([self.block(b) for b in range(first, last + 1)])
+            return values[start - first * self.block_size:stop - first * self.block_size:step]
+        if not -self.count <= key < self.count:
+            raise IndexError(f"第 {key} 项超出范围，共 {self.count} 项")
+        key %= self.count
+        return int(self.block(key // self.block_size)[key % self.block_size])
+
+
+JOURNAL_PATH = "output_journal.bin"
+JOURNAL_RECORD = struct.Struct("<QQI")  # 每条记录的头部：起始项、项数、数据的CRC32，后面紧跟uint16的数据
+
+
+def append_journal(file, start_index, values):
+    """把完成的一批结果追加到日志中"""
+    payload = np.ascontiguousarray(values, dtype=np.uint16).tobytes()
+    file.write(JOURNAL_RECORD.pack(start_index, len(values), zlib.crc32(payload)) + payload)
+    file.flush()
+
+
+def scan_journal(file_path=JOURNAL_PATH):
+    """
+    读取日志中所有完整且校验通过的记录，返回 ([(起始项, uint16数组), ...], 这些记录占用的字节数)
+    最后一条记录可能因为中断只写了一半，遇到不完整或校验不通过的记录就停止
+    """
+    records = []
+    valid_bytes = 0
+    if not os.path.exists(file_path):
+        return records, valid_bytes
+    with open(file_path, "rb") as f:
+        while True:
+            header = f.read(JOURNAL_RECORD.size)
+            if len(header) < JOURNAL_RECORD.size:
+                if header:
+                    logger.info(f"日志 {file_path} 末尾有一条不完整的记录头，已忽略。")
+                break
+            start_index, count, checksum = JOURNAL_RECORD.unpack(header)
+            payload = f.read(2 * count)
+            if len(payload) < 2 * count or zlib.crc32(payload) != checksum:
+                logger.info(f"日志 {file_path} 末尾有一条不完整的记录（第 {start_index + 1} 项起），已忽略。")
+                break
+            records.append((start_index, np.frombuffer(payload, dtype=np.uint16)))
+            valid_bytes = f.tell()
+    return records, valid_bytes
+
+
+def read_journal(file_path=JOURNAL_PATH):
+    """日志中所有完整且校验通过的记录"""
+    return scan_journal(file_path)[0]
+
+
+def truncate_journal(file_path=JOURNAL_PATH):
+    """
+    把日志截到最后一条完整的记录为止
+
+    读取时遇到不完整的记录就会停止，如果不截掉，之后追加的记录都会排在它后面，再也读不到
+    """
+    if not os.path.exists(file_path):
+        return
+    _, valid_bytes = scan_journal(file_path)
+    if os.path.getsize(file_path) > valid_bytes:
+        with open(file_path, "r+b") as f:
+            f.truncate(valid_bytes)
+
+
+def compact_journal(keep_from, file_path=JOURNAL_PATH):
+    """结果文件已经连续包含前 keep_from 项，日志中完全落在这之前的记录都可以删掉"""
+    records = read_journal(file_path)
+    kept = [(start, values) for start, values in records if start + len(values) > keep_from]
+    if not kept:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return
+    if len(kept) == len(records):
+        return
+    with open(file_path + ".tmp", "wb") as f:
+        for start, values in kept:
+            append_journal(f, start, values)
+    os.replace(file_path + ".tmp", file_path)
+
+
+def missing_ranges(start_index, end_index, done_ranges):
+    """[start_index, end_index) 中去掉 done_ranges 后剩下的区间"""
+    ranges = []
+    i = start_index
+    for done_start, done_end in sorted(done_ranges):
+        if done_start > i:
+            ranges.append((i, min(done_start, end_index)))
+        i = max(i, done_end)
+        if i >= end_index:
+            break
+    if i < end_index:
+        ranges.append((i, end_index))
+    return [(a, b) for a, b in ranges if a < b]
+
+
+RESULT_RING_TERMS = 1 << 22  # 共享内存中环形缓冲区最多容纳的项数（uint16，8MB），与n无关
+
+shared_block = None  # 工作进程中打开的共享内存
+shared_results = None  # 共享内存上的环形缓冲区，第i项存放在第 i % len(shared_results) 个位置
+
+
+def ring_read(ring, start_index, count):
+    """环形缓冲区中从第start_index项起的count项，跨过末尾时把两段拼起来"""
+    position = start_index % len(ring)
+    if position + count <= len(ring):
+        return ring[position:position + count]
+    return np.concatenate((ring[position:], ring[:position + count - len(ring)]))
+
+
+def ring_write(ring, start_index, values):
+    """把从第start_index项起的一段结果写进环形缓冲区，跨过末尾时分两段写"""
+    position = start_index % len(ring)
+    head = min(len(values), len(ring) - position)
+    ring[position:position + head] = values[:head]
+    ring[:len(values) - head] = values[head:]
+
+
+def calculate_batch_task(task):
+    """
+    进程池中的任务：把结果直接写进共享内存中的环形缓冲区，只返回 (起始项, 项数, 由闭式得出的项数) 作为完成通知
+
+    这样结果不需要pickle后再经过管道传回主进程
+    主进程只在这些位置上的旧结果都已写入文件后才会提交这个任务，所以不会覆盖还没写出的结果
+    """
+    start_index, batch_size, mode = task
+    analytic_before = analytic_terms
+    results = calculate_batch(start_index, batch_size, mode)
+    ring_write(shared_results, start_index, results)
+    return start_index, batch_size, analytic_terms - analytic_before
+
+
+class OrderedCollector:
+    """
+    按起始项重新排序的缓冲区
+
+    各个批次按完成的先后通知主进程，先完成的不一定是前面的批次
+    这里把完成的批次按起始项记下来，只要从 next_index 开始的前缀连续了，就立即从环形缓冲区中按顺序取出写入文件
+    缓冲区中只记录乱序到达、还不能写入的批次的项数（从日志中恢复的批次则直接记下它的结果）
+    写入文件之后，这些项在环形缓冲区中的位置就空出来了，has_room 据此判断能否提交下一个任务
+    每一批完成时都会先追加到日志中，所以中断时还在缓冲区里的批次下次也能恢复
+    """
+
+    def __init__(self, file, next_index, results, journal=None):
+        self.file = file
+        self.next_index = next_index
+        self.results = results
+        self.journal = journal
+        self.pending = {}
+
+    def has_room(self, start_index, count):
+        """第start_index项起的count项在环形缓冲区中的位置是否都已空出"""
+        return start_index + count - self.next_index <= len(self.results)
+
+    def add(self, start_index, count, values=None):
+        """values 为 None 时结果在环形缓冲区中，否则是从日志中恢复的结果"""
+        if values is None and self.journal is not None:
+            append_journal(self.journal, start_index, ring_read(self.results, start_index, count))  # 先记入日志，中断了也不会丢
+        self.pending[start_index] = count if values is None else values
+        flushed = False
+        while self.next_index in self.pending:
+            item = self.pending.pop(self.next_index)
+            values = ring_read(self.results, self.next_index, item) if isinstance(item, int) else item
+            append_results(self.file, values)
+            self.next_index += len(values)
+            flushed = True
+        if flushed:
+            self.file.flush()
+
+
+BITS_PER_K = math.log2((1 + 5 ** 0.5) / 2)  # F(k)大约有0.694k位
+CHUNKS_PER_CORE = 16  # 按代价切分时，每个核心平均分到的批次数
+
+
+def operand_bits(index):
+    """第index项的斐波那契数大约有多少位"""
+    return BITS_PER_K * (12 * index + 3) + 64
+
+
+def time_operation(operation, repeat=5):
+    """取多次运行中最快的一次，减少干扰"""
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        operation()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+cost_calibration = None
+
+
+def calibrate_cost_model(sizes=(1 << 14, 1 << 16, 1 << 18, 1 << 20)):
+    """
+    在本机上测量两种基本运算的耗时随位数b的变化，并拟合成 c * b^α：
+    "mul" 是两个b位大数相乘（快速倍增的每一步），"linear" 是小数乘b位大数再相加（Q^12推进的每一步）
+    """
+    global cost_calibration
+    if cost_calibration is None:
+        mul_times, linear_times = [], []
+        for bits in sizes:
+            x = gmpy2.mpz(1) << bits - 1 | 12345
+            y = gmpy2.mpz(1) << bits - 1 | 67891
+            mul_times.append(time_operation(lambda: gmpy2.mul(x, y)))
+            linear_times.append(time_operation(lambda: gmpy2.mul(x, 233) + gmpy2.mul(y, 144)))
+        log_sizes = np.log(sizes)
+        fits = []
+        for times in (mul_times, linear_times):
+            exponent, log_coef = np.polyfit(log_sizes, np.log(times), 1)
+            fits.append((math.exp(log_coef), exponent))
+        cost_calibration = {"mul": fits[0], "linear": fits[1]}
+        logger.info(f"代价模型校准：大数乘法 ∝ b^{fits[0][1]:.2f}，小数乘大数 ∝ b^{fits[1][1]:.2f}")
+    return cost_calibration
+
+
+class CostModel:
+    """
+    每一项的预计耗时 f(index) = coef * bits^exponent，以及每个批次开头的一次性代价 seed_cost
+
+    bits随index线性增长，所以f的积分（前缀代价）和它的反函数都有闭式，切分批次时不需要逐项累加
+    """
+
+    def __init__(self, mode, calibration):
+        mul_coef, mul_exponent = calibration["mul"]
+        linear_coef, linear_exponent = calibration["linear"]
+        self.seed = (0.0, 0.0)
+        if mode in ("doubling", "xmpz"):
+            self.term = (6 * mul_coef, mul_exponent)  # 每一位3次乘法，位数逐级减半，合计约为最后一步的两倍
+        elif mode in ("step", "cython"):
+            self.term = (3 * linear_coef, linear_exponent)  # 推进一步加上组合Ln
+            self.seed = (6 * mul_coef, mul_exponent)  # 批次开头的一次快速倍增
+        else:
+            self.term = (linear_coef * 64 ** linear_exponent, 0.0)  # 截断/查表类的模式，每一项的代价与index无关
+
+    def cumulative(self, index):
+        coef, exponent = self.term
+        return coef * operand_bits(index) ** (exponent + 1) / ((exponent + 1) * 12 * BITS_PER_K)
+
+    def inverse_cumulative(self, cost):
+        coef, exponent = self.term
+        bits = (cost * (exponent + 1) * 12 * BITS_PER_K / coef) ** (1 / (exponent + 1))
+        return (bits - 64) / (12 * BITS_PER_K) - 0.25
+
+    def seed_cost(self, index):
+        coef, exponent = self.seed
+        return coef * operand_bits(index) ** exponent if coef else 0.0
+
+    def chunk_cost(self, start_index, end_index):
+        return self.cumulative(end_index) - self.cumulative(start_index) + self.seed_cost(start_index)
+
+
+def plan_chunks(start_index, end_index, model, chunk_count):
+    """
+    把 [start_index, end_index) 切成预计代价大致相等的批次，按起始项从小到大排列
+
+    后面的项更贵，所以越往后批次越短；固定的batch_size会让最后几个巨大的批次拖住整个进程池
+    除了最后一个较小的剩余批次，各批次的代价都相同，所以按顺序提交就是按代价从大到小提交
+    结果要经过大小固定的环形缓冲区写入文件，批次必须按顺序提交，不能再按代价重排
+    返回 [(起始项, 项数, 预计代价), ...]
+    """
+    target = (model.chunk_cost(start_index, end_index) + model.seed_cost(end_index) * chunk_count) / chunk_count
+    chunks = []
+    i = start_index
+    while i < end_index:
+        stream_cost = max(target - model.seed_cost(i), target / chunk_count)
+        j = math.ceil(model.inverse_cumulative(model.cumulative(i) + stream_cost))
+        j = min(max(j, i + 1), end_index)
+        chunks.append((i, j - i, model.chunk_cost(i, j)))
+        i = j
+    return chunks
+
+
+PROGRESS_INTERVAL = 5  # 进度信息最短的输出间隔（秒）
+
+
+class ProgressReporter:
+    """
+    每完成一批更新一次计数（O(1)），每隔 interval 秒输出一次进度、速度和预计剩余时间
+    show_analytic 为 True 时（theorem 模式）还输出到目前为止由闭式直接得出的比例
+    """
+
+    def __init__(self, total, interval=PROGRESS_INTERVAL, show_analytic=False):
+        self.total = total
+        self.interval = interval
+        self.show_analytic = show_analytic
+        self.done = 0
+        self.analytic = 0
+        self.start_time = time.time()
+        self.last_report = self.start_time
+
+    def update(self, count, analytic=0):
+        self.done += count
+        self.analytic += analytic
+        now = time.time()
+        if now - self.last_report < self.interval and self.done < self.total:
+            return
+        self.last_report = now
+        rate = self.done / max(now - self.start_time, 1e-9)
+        eta = (self.total - self.done) / rate if rate else float("inf")
+        coverage = f"，{self.analytic / self.done:.2%} 由闭式直接得出" if self.show_analytic else ""
+        logger.info(f"进度：{self.done}/{self.total}（{self.done / self.total:.2%}），{rate:.1f} 项/秒，预计还需 {eta:.1f} 秒{coverage}")
+
+
+def plan_tasks(start_index, end_index, batch_size, mode, schedule="cost"):
+    """
+    切分任务，schedule 可选：
+    "cost"：按代价模型切分成许多预计耗时相等的批次
+    "partition"：每个进程只分到一段连续的区间（同样按代价均分），整段只做一次快速倍增，之后都用Q^12推进，只适用于 PARTITION_MODES
+    "fixed"：按固定的 batch_size 切分，任务是惰性生成的，n再大也不会预先生成所有任务
+    """
+    if schedule == "fixed":
+        return ((i, min(batch_size, end_index - i), mode) for i in range(start_index, end_index, batch_size))
+    if schedule == "partition":
+        if mode not in PARTITION_MODES:
+            raise ValueError(f"{mode} 模式不能按 partition 切分，可选：{', '.join(sorted(PARTITION_MODES))}")
+        chunk_count = os.cpu_count() or 1
+    elif schedule == "cost":
+        chunk_count = (os.cpu_count() or 1) * CHUNKS_PER_CORE
+    else:
+        raise ValueError(f"未知的切分方式：{schedule}")
+    chunks = plan_chunks(start_index, end_index, CostModel(mode, calibrate_cost_model()), chunk_count)
+    logger.info(f"按代价模型切分为 {len(chunks)} 个批次，最大的批次 {max(c[1] for c in chunks)} 项，最小的 {min(c[1] for c in chunks)} 项")
+    return [(chunk_start, chunk_size, mode) for chunk_start, chunk_size, _ in chunks]
+
+
+MEMORY_BUDGET = None  # 所有进行中的任务合计允许占用的内存（字节），None表示启动时可用内存的80%
+MPZ_COPIES = 12  # 一个任务中同时存在的、与F(k)同样大小的大整数个数的估计（乘积是两倍大小）
+WORKER_BASE_BYTES = 64 * 1024 * 1024 + CACHE_BYTES  # 与index无关的部分：解释器、numpy、周期表，以及缓存的上限
+BIG_INTEGER_MODES = {"doubling", "xmpz", "step", "cython"}  # 内存随index增长的模式
+
+
+def available_memory():
+    """当前可用的物理内存（字节），无法获取时返回None"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def task_memory(task):
+    """按批次最后一项的位数估计一个任务在 WORKER_BASE_BYTES 之外的内存峰值"""
+    start_index, batch_size, mode = task
+    if mode not in BIG_INTEGER_MODES:
+        return 0
+    return MPZ_COPIES * int(operand_bits(start_index + batch_size)) // 8
+
+
+class MemoryAdmission:
+    """
+    按内存预算决定能否再提交一个任务
+
+    每个提交出去的任务都按估计的峰值占用一份预算，完成时归还
+    预算不够时暂停提交，已提交的任务完成、归还预算后会自动恢复，所以并发数随index的增长逐渐降低，遇到小任务时又会回升
+    没有任务在运行时总是放行，单个任务超出预算也只是让它独占整台机器
+    进程池中的workers个进程即使空闲也各自占着 WORKER_BASE_BYTES（其中包括缓存），这部分先从预算中扣除
+    """
+
+    def __init__(self, budget=None, workers=None):
+        if budget is None:
+            available = available_memory()
+            budget = int(available * 0.8) if available else math.inf
+        resident = (workers or os.cpu_count() or 1) * WORKER_BASE_BYTES
+        if resident > budget:
+            logger.info(f"{resident / 2 ** 20:.0f} MB 的常驻内存已超出 {budget / 2 ** 20:.0f} MB 的预算，任务将逐个运行")
+        self.budget = max(budget - resident, 0)
+        self.reserved = {}
+        self.total = 0
+        self.concurrency = None  # 上一次因预算不足而暂停时进行中的任务数，只在它变化时输出信息
+
+    def admit(self, task):
+        need = task_memory(task)
+        if self.reserved and self.total + need > self.budget:
+            if len(self.reserved) != self.concurrency:
+                self.concurrency = len(self.reserved)
+                logger.info(f"内存预算不足，同时进行的任务数限制为 {self.concurrency}："
+                            f"预计占用 {self.total / 2 ** 20:.0f} MB，预算 {self.budget / 2 ** 20:.0f} MB")
+            return False
+        self.reserved[task[0]] = need
+        self.total += need
+        return True
+
+    def release(self, start_index):
+        self.total -= self.reserved.pop(start_index)
+
+
+MAX_IN_FLIGHT_PER_CORE = 2  # 每个核心最多同时提交的任务数
+
+
+def split_tasks(tasks, limit):
+    """把超过limit项的任务切成连续的几段，这样同时进行的任务总能放进环形缓冲区"""
+    for start_index, batch_size, mode in tasks:
+        for i in range(start_index, start_index + batch_size, limit):
+            yield i, min(limit, start_index + batch_size - i), mode
+
+
+def perform_computations(pool, ranges, collector, batch_size=100, mode=DEFAULT_MODE, schedule="cost", max_in_flight=None,
+                         memory_budget=MEMORY_BUDGET, keep_pool=False):
+    """
+    计算 ranges 中的每一个区间 [start_index, end_index)，结果交给 collector 按顺序写入
+
+    每个任务完成时由回调把结果放进完成队列，主进程阻塞在队列上等待，不需要轮询任何 AsyncResult
+    同时提交给进程池的任务最多 max_in_flight 个，每完成一个才提交下一个
+    任务按起始项的顺序提交，并且只有它在环形缓冲区中的位置已经空出（之前的结果都已写入文件）时才提交
+    每个任务最多 RESULT_RING_TERMS / max_in_flight 项，更大的任务（比如 partition 切分出的整段）会被切开
+    这样主进程中的 AsyncResult、进程池的任务队列、乱序缓冲区和共享内存的大小都与n无关
+    此外每个任务还要经过内存预算的准入，index很大时同时运行的任务会少于进程数
+    keep_pool=True 时正常结束后不关闭进程池（常驻服务），中断或出错时仍会终止它
+    """
+    if max_in_flight is None:
+        max_in_flight = (os.cpu_count() or 1) * MAX_IN_FLIGHT_PER_CORE
+    completed = queue.Queue()
+    progress = ProgressReporter(sum(end_index - start_index for start_index, end_index in ranges),
+                                show_analytic=mode == "theorem")
+    tasks = split_tasks(itertools.chain.from_iterable(
+        plan_tasks(start_index, end_index, batch_size, mode, schedule) for start_index, end_index in ranges
+    ), max(RESULT_RING_TERMS // max_in_flight, 1))
+    admission = MemoryAdmission(memory_budget)
+    in_flight = 0
+    waiting = None  # 因为内存预算不足而暂缓提交的任务
+
+    def submit_more():
+        nonlocal in_flight, waiting
+        while in_flight < max_in_flight:
+            task = waiting or next(tasks, None)
+            waiting = None
+            if task is None:
+                return
+            if not collector.has_room(task[0], task[1]) or not admission.admit(task):
+                waiting = task
+                return
+            pool.apply_async(calculate_batch_task, (task,), callback=completed.put, error_callback=completed.put)
+            in_flight += 1
+
+    submit_more()
+    interrupted = False
+    closing = not keep_pool
+    try:
+        while in_flight:
+            item = completed.get()
+            in_flight -= 1
+            if isinstance(item, BaseException):
+                raise item
+            batch_start, count, analytic = item
+            admission.release(batch_start)
+            collector.add(batch_start, count)
+            progress.update(count, analytic)
+            submit_more()
+    except KeyboardInterrupt:
+        logger.info("用户中断了计算。正在保存当前结果...")
+        interrupted = closing = True
+        pool.terminate()  # 立即停止所有进程
+    except BaseException:
+        closing = True
+        pool.terminate()  # 任务出错时同样停止所有进程，再把异常抛给调用者
+        raise
+    else:
+        if closing:
+            pool.close()  # 阻止更多任务提交到进程池
+    finally:
+        if closing:
+            pool.join()  # 等待进程池中的进程结束
+    return interrupted
+
+
+def initialize_results(latest_file_path):
+    """
+    打开结果文件 RESULT_LOG，只读取提交记录
+    还没有它时，把旧版的 output_n={n}.bin / .txt 中最新的一个导入进来作为第一段
+    它存在但头部中的项数为0、又没有 .commit 文件时（旧版本在第一次运行一项都没提交时留下的），当作空的结果文件
+    """
+    log = ResultLog()
+    if log.count or os.path.exists(log.commit_path):
+        logger.info(f"{RESULT_LOG} 中已有 {log.count} 个结果。")
+        return log
+    if latest_file_path and os.path.abspath(latest_file_path) == os.path.abspath(RESULT_LOG):
+        logger.info(f"{RESULT_LOG} 中还没有提交任何结果，将从头开始计算。")
+    elif latest_file_path:
+        try:
+            if latest_file_path.endswith(".txt"):
+                logger.info(f"正在把旧版的文本文件 {latest_file_path} 转换为二进制格式...")
+                latest_file_path = import_text_results(latest_file_path)
+            results = open_results(latest_file_path)
+            append_results(log.begin(), results)
+            log.commit()
+            logger.info(f"已从文件 {latest_file_path} 中导入 {len(results)} 个结果到 {RESULT_LOG}。")
+        except FileNotFoundError:
+            logger.info("文件不存在，将创建新文件并从头开始计算。")
+    else:
+        logger.info("未找到现有文件，将创建新文件并从头开始计算。")
+    return log
+
+
+log_queue = None  # 工作进程的日志记录经这个队列汇总到主进程
+log_listener = None
+
+
+def start_log_listener():
+    """
+    在主进程中启动日志监听线程，返回日志队列
+
+    工作进程不再直接写stderr，只把记录放进队列，由这一个线程按顺序输出，多个进程的输出也不会交错
+    """
+    global log_queue, log_listener
+    if log_listener is None:
+        log_queue = multiprocessing.Queue()
+        log_listener = QueueListener(log_queue, *logger.handlers, respect_handler_level=True)
+        log_listener.start()
+    return log_queue
+
+
+def stop_log_listener():
+    """输出队列中剩余的记录后停止监听线程"""
+    global log_queue, log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_queue.close()
+        log_queue = log_listener = None
+
+
+def init_worker(step_matrix, shared_name, count, queue_for_logs=None):
+    """
+    进程池的初始化函数：
+    主进程算好的Q^12只在创建进程时传一次，之后每个任务都不必再传
+    日志改为经 QueueHandler 送回主进程输出（线程池与主进程共用日志，不需要）
+    按名字打开主进程创建的共享内存，在上面建立count项的环形缓冲区
+    """
+    global STEP_MATRIX, shared_block, shared_results
+    STEP_MATRIX = step_matrix
+    if queue_for_logs is not None:
+        logger.handlers[:] = [QueueHandler(queue_for_logs)]
+    shared_block = shared_memory.SharedMemory(name=shared_name)
+    shared_results = np.ndarray((count,), dtype=np.uint16, buffer=shared_block.buf)
+
+
+def initialize_pool(shared_block, count, mode=DEFAULT_MODE):
+    """初始化进程池"""
+    prepare_mode(mode)
+    pool_size = os.cpu_count()  # 获取CPU核心数
+    initargs = (STEP_MATRIX, shared_block.name, count)
+    if mode in NOGIL_MODES:
+        return ThreadPool(processes=pool_size, initializer=init_worker, initargs=initargs)
+    initargs += (start_log_listener(),)
+    return Pool(processes=pool_size, initializer=init_worker, initargs=initargs)  # 根据核心数设置进程池大小
+
+
+def shutdown_pool(pool, interrupted):
+    """关闭进程池"""
+    if interrupted:
+        pool.terminate()
+    pool.join()
+
+
+def restore_from_journal(start_index, end_index):
+    """日志中落在 [start_index, end_index) 内的结果，重叠或相邻的合并为一段，返回 [(起始项, uint16数组), ...]"""
+    pieces = []
+    for record_start, values in read_journal():
+        a, b = max(record_start, start_index), min(record_start + len(values), end_index)
+        if a < b:
+            pieces.append((a, values[a - record_start:b - record_start]))
+    merged = []
+    for a, values in sorted(pieces, key=lambda piece: piece[0]):
+        if merged and a <= merged[-1][0] + len(merged[-1][1]):
+            last_start, last_values = merged[-1]
+            overlap = last_start + len(last_values) - a
+            if len(values) > overlap:
+                merged[-1] = (last_start, np.concatenate((last_values, values[overlap:])))
+        else:
+            merged.append((a, values))
+    if merged:
+        logger.info(f"已从日志 {JOURNAL_PATH} 中恢复 {sum(len(values) for _, values in merged)} 个结果。")
+    return merged
+
+
+def extend_results(pool, log, ring, n, batch_size=100, mode=DEFAULT_MODE, schedule="cost", keep_pool=False):
+    """
+    把结果文件从已提交的 log.count 项扩展到前n项，单次运行和常驻服务共用
+
+    先放回日志中已有的批次，再计算剩下的区间，新结果经过环形缓冲区ring按顺序追加并提交
+    返回 (已写入的项数, 是否被中断)
+    """
+    start_index = log.count
+    restored = restore_from_journal(start_index, n)
+    truncate_journal()  # 上次中断时写了一半的记录必须先截掉，否则新的记录都排在它后面
+    with open(JOURNAL_PATH, "ab") as journal:
+        collector = OrderedCollector(log.begin(), start_index, ring, journal)  # 只追加新的项
+        try:
+            for restored_start, values in restored:
+                collector.add(restored_start, len(values), values)
+            ranges = missing_ranges(start_index, n, [(a, a + len(values)) for a, values in restored])
+            interrupted = perform_computations(pool, ranges, collector, batch_size, mode, schedule, keep_pool=keep_pool)
+        finally:
+            log.commit()  # 出错时也提交已经按顺序写入的部分
+            collector.results = None
+    compact_journal(collector.next_index)
+    evict_checkpoints()
+    return collector.next_index, interrupted
+
+
+def main_flow(n, latest_file_path, batch_size=100, mode=DEFAULT_MODE, schedule="cost"):
+    """流程控制函数，计算的同时按顺序写入文件，返回输出文件名、项数和是否被中断"""
+    log = initialize_results(latest_file_path)
+    start_index = log.count
+    if n <= start_index:
+        logger.info(f"文件中已包含 {start_index} 个数，无需进行更多计算。")
+        write_results(f"output_n={n}.bin", log.open_results()[:n])  # 单独导出前n项
+        return f"output_n={n}.bin", n, True
+    # 每一项的2-adic都放得进uint16，新结果经过共享内存中的环形缓冲区写入文件，缓冲区的大小与n无关
+    ring_size = min(RESULT_RING_TERMS, n - start_index)
+    block = shared_memory.SharedMemory(create=True, size=2 * ring_size)
+    try:
+        pool = initialize_pool(block, ring_size, mode)
+        ring = np.ndarray((ring_size,), dtype=np.uint16, buffer=block.buf)
+        count, interrupted = extend_results(pool, log, ring, n, batch_size, mode, schedule)
+        ring = None  # 释放对共享内存的引用，否则无法关闭
+        shutdown_pool(pool, interrupted)
+    finally:
+        try:
+            block.close()
+        except BufferError:
+            pass  # 出错时异常的回溯中仍引用着结果数组，进程退出时会自动释放
+        block.unlink()
+    return RESULT_LOG, count, interrupted
+
+
+def get_results(log, indices):
+    """
+    抽查任意一组项（比如查找 unique_num 所在的位置），按请求的顺序返回它们的2-adic
+
+    已提交的项直接从结果文件中读，其余的交给 calculate_sparse 单独计算，不会扩展结果文件
+    """
+    indices = [int(index) for index in indices]
+    if any(index < 0 for index in indices):
+        raise ValueError(f"index 不能为负数：{indices}")
+    results = log.open_results()
+    computed = calculate_sparse(index for index in indices if index >= len(results))
+    return [int(results[index]) if index < len(results) else computed[index] for index in indices]
+
+
+SOCKET_PATH = "output_daemon.sock"
+
+
+class WarmService:
+    """
+    常驻的计算服务
+
+    进程池、各进程中的斐波那契缓存和代价模型的校准结果都一直保留在内存中
+    每个请求只需计算还没有的项，不必重新创建进程、导入模块和预热缓存
+    计算本身与单次运行相同（extend_results）：同样经过环形缓冲区、日志、内存预算和同时进行的任务数上限
+    已有的结果不复制进内存，取区间时直接切片 memmap 打开的结果文件，常用的部分留在页缓存中，进程占用的内存与n无关
+    """
+
+    def __init__(self, mode=DEFAULT_MODE, schedule="cost", batch_size=100):
+        self.mode = mode
+        self.schedule = schedule
+        self.batch_size = batch_size
+        self.log = initialize_results(Catalog().latest())
+        self.block = shared_memory.SharedMemory(create=True, size=2 * RESULT_RING_TERMS)
+        self.ring = np.ndarray((RESULT_RING_TERMS,), dtype=np.uint16, buffer=self.block.buf)
+        self.pool = initialize_pool(self.block, RESULT_RING_TERMS, mode)
+
+    def extend(self, n):
+        """把结果扩展到前n项，只把新的项追加到结果文件中"""
+        if n <= self.log.count:
+            return
+        try:
+            _, interrupted = extend_results(self.pool, self.log, self.ring, n, self.batch_size, self.mode, self.schedule,
+                                            keep_pool=True)
+        except BaseException:
+            self.pool = initialize_pool(self.block, RESULT_RING_TERMS, self.mode)  # 出错时进程池已被终止，重新创建
+            raise
+        if interrupted:
+            raise KeyboardInterrupt
+        logger.info(f"已扩展到 {n} 项，追加到 {RESULT_LOG}")
+
+    def handle(self, request):
+        """处理一个请求，返回回复的字典"""
+        if not isinstance(request, dict):
+            raise ValueError(f"请求应为JSON对象：{request!r}")
+        command = request.get("cmd")
+        if command == "extend":
+            self.extend(int(request["n"]))
+            return {"ok": True, "count": self.log.count, "file": RESULT_LOG}
+        if command == "range":
+            start_index, end_index = int(request["start"]), int(request["end"])
+            if not 0 <= start_index <= end_index:
+                raise ValueError(f"无效的区间：[{start_index}, {end_index})")
+            self.extend(end_index)
+            return {"ok": True, "values": self.log.open_results()[start_index:end_index].tolist()}
+        if command == "get":
+            return {"ok": True, "values": get_results(self.log, request["indices"])}
+        if command in ("ping", "stop"):
+            return {"ok": True}
+        raise ValueError(f"未知的请求：{command}")
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        stop_log_listener()
+        self.ring = None  # 释放对共享内存的引用，否则无法关闭
+        self.block.close()
+        self.block.unlink()
+
+
+class ServiceHandler(socketserver.StreamRequestHandler):
+    """每行一个JSON请求，每个请求回复一行JSON"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)  # 格式错误的请求也回复一行错误信息，不中断连接
+                reply = self.server.service.handle(request)
+            except Exception as e:
+                reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+            if reply["ok"] and request.get("cmd") == "stop":
+                self.server.stopping = True
+                return
+
+
+def serve(socket_path=SOCKET_PATH, mode=DEFAULT_MODE, schedule="cost"):
+    """
+    启动常驻服务，在Unix socket上逐个处理请求，直到收到 {"cmd": "stop"} 或 Ctrl+C
+    请求格式：{"cmd": "extend", "n": 100000}、{"cmd": "range", "start": a, "end": b}、{"cmd": "get", "indices": [i, j, ...]}
+    """
+    if os.path.exists(socket_path):
+        try:
+            query({"cmd": "ping"}, socket_path)
+        except ConnectionRefusedError:
+            os.remove(socket_path)  # 上次没有正常退出留下的socket文件
+        else:
+            raise RuntimeError(f"{socket_path} 上已经有服务在运行")
+    service = WarmService(mode, schedule)
+    try:
+        with socketserver.UnixStreamServer(socket_path, ServiceHandler) as server:
+            server.service = service
+            server.stopping = False
+            logger.info(f"服务已启动，正在监听 {socket_path}")
+            while not server.stopping:
+                server.handle_request()
+    except KeyboardInterrupt:
+        logger.info("用户中断了服务。")
+    finally:
+        service.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def query(request, socket_path=SOCKET_PATH):
+    """向常驻服务发送一个请求并返回回复"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(request) + "\n").encode())
+        reply = json.loads(client.makefile("rb").readline())
+    if not reply["ok"]:
+        raise RuntimeError(reply["error"])
+    return reply
+
+
+def main(n, mode=DEFAULT_MODE, schedule="cost"):
+    """主函数"""
+    start_time = time.time()
+    latest_file_path = Catalog().latest()
+    try:
+        output_filename, count, interrupted = main_flow(n, latest_file_path, mode=mode, schedule=schedule)
+    finally:
+        stop_log_listener()
+    logger.info(f"{count} 个结果已写入到 {output_filename}")
+    end_time = time.time()
+    logger.info(f"程序运行时间: {end_time - start_time} 秒。")
+
+
+if __name__ == "__main__":
+    try:
+        if sys.argv[1:] == ["serve"]:
+            serve()  # python run_generate_ver27_单文件战神版.py serve
+        elif sys.argv[1:] == ["compress"]:
+            compressed_path, ratio = compress_results()
+            logger.info(f"已压缩到 {compressed_path}，压缩比 {ratio:.1f}")
+        elif sys.argv[1:] == ["verify"]:
+            bad_segments = ResultLog().verify()
+            logger.info(f"校验不通过的段：{bad_segments}" if bad_segments else f"{RESULT_LOG} 的所有段校验通过。")
+        elif len(sys.argv) > 2 and sys.argv[1] == "get":
+            # python run_generate_ver27_单文件战神版.py get 5 1000 123456789（index从0开始）
+            for index, value in zip(sys.argv[2:], get_results(ResultLog(), sys.argv[2:])):
+                logger.info(f"index = {index}（第 {int(index) + 1} 个数）的 2-adic 为：{value}")
+        elif len(sys.argv) == 3 and sys.argv[1] in ("import", "export"):
+            # python run_generate_ver27_单文件战神版.py import output_n=1000.txt（export 则反过来）
+            convert = import_text_results if sys.argv[1] == "import" else export_text_results
+            logger.info(f"已写入到 {convert(sys.argv[2])}")
+        else:
+            n = int(input("请输入n: "))
+            main(n)
+    except KeyboardInterrupt:
+        logger.info("用户中断了程序。")
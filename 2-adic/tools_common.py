@@ -0,0 +1,57 @@
+import os
+import re
+import json
+import struct
+import numpy as np
+
+# 各个 Tools 脚本共用的结果文件读取，与生成脚本（run_generate_ver27）写出的格式一致
+
+RESULT_HEADER = struct.Struct("<8sHHH4sQ")  # 与生成脚本中的结果文件头部一致
+RESULT_HEADER_SIZE = 64
+RESULT_LOG = "output_results.bin"
+CATALOG_PATH = "output_catalog.json"
+
+
+def open_results(file_name):
+    # 二进制结果文件直接用memmap打开，不需要解析；旧版的文本文件照旧读取
+    if file_name.endswith(".txt"):
+        with open(file_name, "r") as file:
+            return np.array(file.read().split(), dtype=np.int64)
+    with open(file_name, "rb") as file:
+        magic, _, multiplier, offset, dtype, count = RESULT_HEADER.unpack(file.read(RESULT_HEADER.size))
+    if magic != b"2ADICVAL" or (multiplier, offset) != (12, 3):
+        raise ValueError(f"{file_name} 不是 k = 12i+3 的结果文件")
+    return np.memmap(file_name, dtype=dtype.rstrip(b"\0").decode(), mode="r", offset=RESULT_HEADER_SIZE, shape=(count,))
+
+
+def catalog_latest_file():
+    # 从生成脚本维护的结果目录中查出最新的结果文件，只有文件还在、大小与记录相符时才采用
+    if not os.path.exists(CATALOG_PATH):
+        return None
+    with open(CATALOG_PATH, "r", encoding="utf-8") as file:
+        catalog = json.load(file)
+    file_name = catalog["latest"].get("k=12i+3")
+    entry = catalog["artifacts"].get(file_name) if file_name else None
+    if entry is None or not os.path.exists(file_name):
+        return None
+    size = os.path.getsize(file_name)
+    valid = size >= entry["bytes"] if entry["format"] == "log" else size == entry["bytes"]  # 结果日志末尾可能有未提交的部分
+    return file_name if valid else None
+
+
+def get_latest_file():
+    latest_file = catalog_latest_file()
+    if latest_file:
+        return latest_file
+    # 没有结果目录或目录中的记录已过期时，扫描当前目录：结果日志按头部中的项数，output_n={n}.bin（或旧版的.txt）按文件名中的n
+    # 取项数最多的文件，项数相同时依次优先取结果日志、.bin
+    candidates = []
+    for file_name in os.listdir("."):
+        if file_name == RESULT_LOG:
+            with open(file_name, "rb") as file:
+                header = file.read(RESULT_HEADER.size)
+            if len(header) == RESULT_HEADER.size:
+                candidates.append((RESULT_HEADER.unpack(header)[-1], 2, file_name))
+        elif re.fullmatch(r"output_n=\d+\.(bin|txt)", file_name):
+            candidates.append((int(re.search(r"output_n=(\d+)", file_name).group(1)), file_name.endswith(".bin"), file_name))
+    return max(candidates)[2] if candidates else None